@@ -6,6 +6,9 @@ import os
 import sys
 sys.path.insert(0, os.path.realpath(__file__))
 
+# get pattern matching tools
+import re
+
 # get SQLite tools
 import sqlite3
 
@@ -19,14 +22,28 @@ import dicommanagersettings as settings
 
 
 
+#------------------------------------------------------------------------------------------------
+# compiles SQL LIKE patterns into a single regular expression matching whole values, case insensitive like LIKE
+# ('%' matches any characters, '_' one character) - returns None for no patterns
+def compileLikePatterns ( patterns ):
+    if not patterns:
+        return None
+    regexes = [ ''.join([ '.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern ]) for pattern in patterns ]
+    return re.compile( r'(?:%s)\Z' % '|'.join(regexes), re.IGNORECASE | re.DOTALL )
+
+
+
 class DicomFeatures:
-    
+
     #--------------------------------------------------------------------------------------------
     def __init__ ( self, dicomManager ):
         self.manager = dicomManager
         self.settings = dicomManager.settings
         self.dbCon = self.manager.dbCon
 
+        # compile the features' classification rules
+        self.features = self.compileFeatures()
+
         # check if the dicom series database table exists
         qResult = None
         with self.dbCon:
@@ -40,42 +57,131 @@ class DicomFeatures:
             return
 
         # check if the features database table exists
+        tblFeatures = self.settings.dbTblFeatures
         qResult = None
         with self.dbCon:
             dbCur = self.dbCon.cursor()
-            dbCur.execute( "SELECT name FROM sqlite_master WHERE type='table' AND name='Features'" )
+            dbCur.execute( "SELECT name FROM sqlite_master WHERE type='table' AND name='%s'" % tblFeatures )
             qResult = dbCur.fetchone()
 
         if qResult is None:
             # Features table doesn't exist - create table in database
-            qCreate = '''
-            CREATE TABLE Features ( 
-                id INTEGER PRIMARY KEY,
-                NumberOfDicoms INTEGER DEFAULT 0 NOT NULL,
-                SeriesDescription TEXT,
-                StudyDescription TEXT,
-                Manufacturer TEXT, 
-                ManufacturerModelName TEXT,
-                InstitutionName TEXT,
-                PatientSex TEXT,
-                PatientAge,
-                SliceThickness,
-                SpacingBetweenSlices,
-                MagneticFieldStrength,
-                ProtocolName TEXT
-                )
-            '''
+            print "Database table '%s' not found. Creating it..." % tblFeatures
             with self.dbCon:
                 dbCur = self.dbCon.cursor()
-                dbCur.execute(qCreate)
+                dbCur.execute( "CREATE TABLE %s ( id INTEGER PRIMARY KEY, SeriesInstanceUID TEXT )" % tblFeatures )
 
-        else:
-            print "Features table already exists."
+        # add columns of features not computed before
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "PRAGMA table_info(%s)" % tblFeatures )
+            colNames = set( row[1] for row in dbCur.fetchall() )
+            for colName in [ 'SeriesInstanceUID' ] + [ feature['name'] for feature in self.features ]:
+                if colName not in colNames:
+                    dbCur.execute( "ALTER TABLE %s ADD COLUMN %s TEXT" % ( tblFeatures, colName ) )
+            for feature in self.features:
+                dbCur.execute( "CREATE INDEX IF NOT EXISTS %s%sIdx ON %s (%s)" % ( tblFeatures, feature['name'], tblFeatures, feature['name'] ) )
 
 
 
-        # create features table
+    #--------------------------------------------------------------------------------------------
+    # compiles the classification rules of the features set in the settings into regular expressions
+    def compileFeatures ( self ):
+        features = []
+        for feature in self.settings.features:
+            rules = []
+            for rule in feature['rules']:
+                rules.append( ( rule['label'],
+                                compileLikePatterns( rule.get('include') ),
+                                compileLikePatterns( rule.get('require') ),
+                                compileLikePatterns( rule.get('exclude') ) ) )
+            features.append( { 'name': feature['name'], 'column': feature['column'], 'rules': rules } )
+        return features
+
 
-        # loop through series
 
-            #  
+    #--------------------------------------------------------------------------------------------
+    # labels a value by the first rule it matches - returns None if it matches none
+    def classify ( self, rules, value ):
+        if value is None:
+            return None
+        if not isinstance(value, basestring):
+            value = unicode(value)
+        for label, include, require, exclude in rules:
+            if include is not None and not include.match(value):
+                continue
+            if require is not None and not require.match(value):
+                continue
+            if exclude is not None and exclude.match(value):
+                continue
+            return label
+        return None
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # computes the features of series not classified yet (or of all series, if full), in batches
+    # returns the number of series classified
+    def run ( self, full=False ):
+        tblSeries = self.settings.dbTblSeries
+        tblFeatures = self.settings.dbTblFeatures
+        batchSize = self.settings.featuresBatchSize
+
+        # check the features' columns
+        srcColumns = []
+        for feature in self.features:
+            if feature['column'] not in self.manager.seriesColumns():
+                print "Can't compute feature '%s'. Column not recorded: %s" % ( feature['name'], feature['column'] )
+                return 0
+            if feature['column'] not in srcColumns:
+                srcColumns.append( feature['column'] )
+        featureNames = [ feature['name'] for feature in self.features ]
+
+        # forget features of deleted series - or, option, of all series to classify them again, e.g. after the rules changed
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            if full:
+                dbCur.execute( "DELETE FROM %s" % tblFeatures )
+            else:
+                dbCur.execute( "DELETE FROM %s WHERE id NOT IN ( SELECT id FROM %s )" % ( tblFeatures, tblSeries ) )
+
+        # series not classified yet - new ones, or ones recorded again under a reused record ID
+        qFind = ( "SELECT s.id, s.SeriesInstanceUID, %s FROM %s AS s LEFT JOIN %s AS f ON f.id = s.id AND f.SeriesInstanceUID = s.SeriesInstanceUID "
+                  "WHERE f.id IS NULL AND s.id > ? ORDER BY s.id LIMIT ?" ) % ( ', '.join([ 's.' + colName for colName in srcColumns ]), tblSeries, tblFeatures )
+        qInsert = "INSERT OR REPLACE INTO %s ( id, SeriesInstanceUID, %s ) VALUES ( %s )" % ( tblFeatures, ', '.join(featureNames), ', '.join([ '?' for i in xrange(len(featureNames) + 2) ]) )
+
+        numClassified = 0
+        lastId = -1
+        while True:
+            with self.dbCon:
+                dbCur = self.dbCon.cursor()
+                dbCur.row_factory = None
+
+                # get a batch of series, as columns
+                dbCur.execute( qFind, (lastId, batchSize) )
+                rows = dbCur.fetchall()
+                if not rows:
+                    break
+                columns = zip(*rows)
+                lastId = columns[0][-1]
+
+                # label each distinct value once per feature
+                featureColumns = []
+                for feature in self.features:
+                    values = columns[ 2 + srcColumns.index( feature['column'] ) ]
+                    rules = feature['rules']
+                    labels = dict( (value, self.classify(rules, value)) for value in set(values) )
+                    featureColumns.append( [ labels[value] for value in values ] )
+
+                # record features
+                dbCur.executemany( qInsert, zip( columns[0], columns[1], *featureColumns ) )
+                numClassified += len(rows)
+
+            # progress
+            sys.stdout.write( " Classified %d series\r" % numClassified )
+            sys.stdout.flush()
+
+        sys.stdout.write( "                                        \r" )
+        sys.stdout.flush()
+
+        return numClassified
@@ -0,0 +1,276 @@
+# dicomfiles.py
+# file transfer tools for the DICOM manager
+
+
+# get file management tools
+import os
+import errno
+import shutil
+import hashlib
+
+# get archiving tools
+import tarfile
+import zipfile
+
+# get zstandard compression, if available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# get tools for cloning files, if available
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl request to clone a file's data, sharing it copy-on-write (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# get in-kernel file copying from the C library, if available (Linux - Python 2 has no os.copy_file_range or os.sendfile)
+try:
+    import ctypes
+    libc = ctypes.CDLL( None, use_errno=True )
+except (ImportError, OSError, TypeError):
+    ctypes = None
+    libc = None
+
+#------------------------------------------------------------------------------------------------
+# gets a function of the C library returning a byte count, or None if the C library doesn't have it
+def libcFunction ( name, argTypes ):
+    function = getattr(libc, name, None) if libc is not None else None
+    if function is not None:
+        function.argtypes = argTypes
+        function.restype = ctypes.c_ssize_t
+    return function
+
+if libc is not None:
+    # copy_file_range(fdIn, offsetIn, fdOut, offsetOut, length, flags) - glibc 2.27+, copies within the filesystem where it can
+    copy_file_range = libcFunction( 'copy_file_range', [ ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t, ctypes.c_uint ] )
+    # sendfile64(fdOut, fdIn, offset, count) - 64-bit offsets on 32-bit systems too
+    sendfile = libcFunction( 'sendfile64', [ ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t ] )
+else:
+    copy_file_range = None
+    sendfile = None
+
+# errors of in-kernel copying not supported for the files given (e.g. an old kernel, or copy_file_range across filesystems)
+kernelCopyUnsupported = frozenset([ errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP ])
+
+
+
+#------------------------------------------------------------------------------------------------
+# copies a file by cloning its data, without copying any bytes
+def reflinkFile ( src, dst ):
+
+    # check cloning is available
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Cloning files is not supported", src)
+
+    with open(src, 'rb') as srcFile:
+        dstFile = open(dst, 'wb')
+        try:
+            fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+        except:
+            # not supported by the filesystem, or across filesystems
+            dstFile.close()
+            os.remove(dst)
+            raise
+        dstFile.close()
+
+
+
+#------------------------------------------------------------------------------------------------
+# copies a file, in the kernel if possible
+def copyFile ( src, dst ):
+
+    # check in-kernel copying is available
+    if copy_file_range is None and sendfile is None:
+        shutil.copyfile(src, dst)
+        return
+
+    with open(src, 'rb') as srcFile:
+        with open(dst, 'wb') as dstFile:
+            if kernelCopy( srcFile.fileno(), dstFile.fileno(), os.fstat(srcFile.fileno()).st_size ):
+                return
+
+    # not supported for these files - copy in user space
+    shutil.copyfile(src, dst)
+
+
+
+#------------------------------------------------------------------------------------------------
+# copies a number of bytes from one open file to another in the kernel, with copy_file_range or else sendfile -
+# returns False if neither is supported for these files, raises other errors
+def kernelCopy ( srcFd, dstFd, size ):
+    copyRange = copy_file_range
+    offset = ctypes.c_int64(0)
+
+    # the kernel advances the source offset, and the destination file's position
+    while offset.value < size:
+        if copyRange is not None:
+            numCopied = copyRange( srcFd, ctypes.byref(offset), dstFd, None, size - offset.value, 0 )
+        else:
+            numCopied = sendfile( dstFd, srcFd, ctypes.byref(offset), size - offset.value )
+
+        if numCopied < 0:
+            errorNumber = ctypes.get_errno()
+            if errorNumber == errno.EINTR:
+                continue
+            if errorNumber not in kernelCopyUnsupported:
+                raise OSError( errorNumber, os.strerror(errorNumber) )
+
+            # continue with sendfile from where copy_file_range stopped
+            if copyRange is not None and sendfile is not None:
+                copyRange = None
+                continue
+            return False
+
+        # the source file was truncated
+        if numCopied == 0:
+            break
+
+    return True
+
+
+
+#------------------------------------------------------------------------------------------------
+# transfers a file with the first of the given methods that works, returning the method used
+#   'rename'   - moves the file (only if move is requested)
+#   'hardlink' - links the file, sharing it with the source
+#   'reflink'  - clones the file's data, copy-on-write
+#   'copy'     - copies the file, in the kernel if possible (copy_file_range or sendfile on Linux), or else in user space
+def transferFile ( src, dst, methods, move=False ):
+    lastError = None
+
+    for method in methods:
+        try:
+            if method == 'rename':
+                if not move:
+                    continue
+                os.rename(src, dst)
+
+            elif method == 'hardlink':
+                os.link(src, dst)
+
+            elif method == 'reflink':
+                reflinkFile(src, dst)
+
+            elif method == 'copy':
+                copyFile(src, dst)
+
+            else:
+                raise ValueError("Unknown file transfer method: %s" % method)
+
+            return method
+
+        except (IOError, OSError), e:
+            # e.g. across filesystems, or not supported by the filesystem - try the next method
+            lastError = e
+
+            # remove any partial copy
+            if method == 'copy' and os.path.isfile(dst):
+                os.remove(dst)
+
+    # no method worked
+    if lastError is None:
+        lastError = IOError("No file transfer method could be used: %s" % ', '.join(methods))
+    raise lastError
+
+
+
+#------------------------------------------------------------------------------------------------
+# copies a directory tree, transferring its files with the first of the given methods that works
+def copyTree ( src, dst, methods ):
+
+    # create destination directories and transfer files
+    for srcDir, dirNames, fileNames in os.walk(src):
+        dstDir = os.path.join( dst, os.path.relpath(srcDir, src) )
+        if not os.path.isdir(dstDir):
+            os.makedirs(dstDir)
+        for fileName in fileNames:
+            transferFile( os.path.join(srcDir, fileName), os.path.join(dstDir, fileName), methods )
+
+
+
+#------------------------------------------------------------------------------------------------
+# computes the SHA-1 hash of a file's content, reading it in large chunks
+def hashFile ( path, chunkSize=1048576 ):
+    fileHash = hashlib.sha1()
+    with open(path, 'rb') as srcFile:
+        chunk = srcFile.read(chunkSize)
+        while chunk:
+            fileHash.update(chunk)
+            chunk = srcFile.read(chunkSize)
+    return fileHash.hexdigest()
+
+
+
+#------------------------------------------------------------------------------------------------
+# streams files into a tar ('tar', 'tar.gz', 'tar.zst') or zip64 ('zip') archive, written to a path or file object
+# (tar archives can be written to pipes; zip archives need a seekable file)
+class ArchiveWriter:
+
+    #--------------------------------------------------------------------------------------------
+    # instantiation - opens the archive
+    def __init__ ( self, archive, archiveFormat='tar', readSize=1048576 ):
+        self.readSize = readSize
+        self.zstdWriter = None
+
+        # check format
+        if archiveFormat not in ('tar', 'tar.gz', 'tar.zst', 'zip'):
+            raise ValueError("Unknown archive format: %s" % archiveFormat)
+        if archiveFormat == 'tar.zst' and zstandard is None:
+            raise ValueError("Archive format 'tar.zst' requires the zstandard module")
+
+        # open destination file, unless given a file object
+        self.ownsFile = isinstance(archive, basestring)
+        self.fileObj = open(archive, 'wb') if self.ownsFile else archive
+
+        # open archive, as a stream to never seek
+        if archiveFormat == 'zip':
+            self.zip = zipfile.ZipFile(self.fileObj, 'w', zipfile.ZIP_STORED, allowZip64=True)
+            self.tar = None
+        elif archiveFormat == 'tar.zst':
+            self.zstdWriter = zstandard.ZstdCompressor().stream_writer(self.fileObj)
+            self.tar = tarfile.open(fileobj=self.zstdWriter, mode='w|')
+            self.zip = None
+        else:
+            self.tar = tarfile.open(fileobj=self.fileObj, mode='w|gz' if archiveFormat == 'tar.gz' else 'w|')
+            self.zip = None
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # adds a file to the archive under the given name, reading it in large sequential chunks
+    def addFile ( self, path, arcName ):
+        if self.tar is not None:
+            tarInfo = self.tar.gettarinfo(path, arcName)
+            with open(path, 'rb', self.readSize) as srcFile:
+                self.tar.addfile(tarInfo, srcFile)
+        else:
+            self.zip.write(path, arcName)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # adds the files of a directory tree to the archive under the given directory name
+    def addTree ( self, src, arcDir ):
+        for srcDir, dirNames, fileNames in os.walk(src):
+            dirNames.sort()
+            arcSubDir = os.path.normpath( os.path.join( arcDir, os.path.relpath(srcDir, src) ) )
+            for fileName in sorted(fileNames):
+                self.addFile( os.path.join(srcDir, fileName), os.path.join(arcSubDir, fileName) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # finishes the archive
+    def close ( self ):
+        if self.tar is not None:
+            self.tar.close()
+        else:
+            self.zip.close()
+        if self.zstdWriter is not None:
+            self.zstdWriter.flush(zstandard.FLUSH_FRAME)
+        if self.ownsFile:
+            self.fileObj.close()
@@ -11,6 +11,30 @@ sys.path.insert(0, os.path.realpath(__file__))
 import shutil
 import fnmatch
 import re
+import stat
+import string
+import struct
+import tempfile
+import datetime
+import bisect
+import json
+import collections
+
+# get fast directory listing with file types, if available
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# get parallel processing tools
+import multiprocessing
+import multiprocessing.pool
+import threading
+import Queue
+import atexit
 
 # get SQLite tools
 import sqlite3
@@ -20,18 +44,260 @@ import dicom
 from dicom._dicom_dict import DicomDictionary
 from dicom.dataset import Dataset, FileDataset
 import dicom.UID
+import dicom.datadict
 
 # get settings
 import dicommanagersettings as settings
 
+# get file transfer tools
+import dicomfiles
+
+# characters removed from storage paths, and the translation tables doing so in a single pass (spaces become underscores)
+storagePathDeleteChars = '`~!@#$%^&*(){}[]|\\:;\'"<>,?'
+storagePathTable = string.maketrans(' ', '_')
+storagePathUnicodeTable = dict( [ (ord(c), None) for c in storagePathDeleteChars ] + [ (ord(' '), u'_') ] )
+
+# SQLite column types of single-valued numeric DICOM value representations - other values are stored as TEXT
+numericVRTypes = { 'DS': 'REAL', 'FL': 'REAL', 'FD': 'REAL', 'IS': 'INTEGER', 'US': 'INTEGER', 'UL': 'INTEGER', 'SS': 'INTEGER', 'SL': 'INTEGER' }
+
+# DICOM value representations of binary data, left out of recorded sequences
+binaryVRs = frozenset([ 'OB', 'OD', 'OF', 'OW', 'UN', 'OB or OW', 'US or OW', 'US or SS or OW' ])
+
+# DICOM value representations, for recognizing explicit VR data elements
+dicomVRs = frozenset([ 'AE', 'AS', 'AT', 'CS', 'DA', 'DS', 'DT', 'FL', 'FD', 'IS', 'LO', 'LT', 'OB', 'OD', 'OF', 'OW',
+                       'PN', 'SH', 'SL', 'SQ', 'SS', 'ST', 'TM', 'UI', 'UL', 'UN', 'US', 'UT' ])
+
+# non-ASCII characters, removed from text values recorded in the database in a single translate pass
+nonAsciiChars = ''.join( chr(i) for i in xrange(128, 256) )
+
+# hashtags in series notes, with optional values - e.g. '#blackImage', '#quality:3', '#reviewed:2016-02-01'
+noteTagPattern = re.compile(r'#([^\s#:]+)(?::([^\s#]+))?')
+
+
+
+#------------------------------------------------------------------------------------------------
+# worker process - reads DICOM paths from one queue and puts the read pydicom objects on another
+def readWorker ( managerSettings, pathQueue, dcmQueue, headerOnly=None ):
+
+    # create a manager without database connection - only the main process writes
+    manager = DicomManager(init=False)
+    manager.settings = managerSettings
+
+    # read DICOMs until the sentinel is received
+    while True:
+        item = pathQueue.get()
+        if item is None:
+            break
+        dcmIdx, dcmPath = item
+        dcmQueue.put( (dcmIdx, dcmPath, manager.read(dcmPath, headerOnly)) )
+
+    # let the writer know this worker is done
+    dcmQueue.put( None )
+
+
+
+#------------------------------------------------------------------------------------------------
+# feeder thread - puts DICOM paths on the workers' queue, waiting for room in the pipeline
+def feedPaths ( dcmPaths, pathQueue, inFlight, numWorkers ):
+    try:
+        for dcmIdx, dcmPath in enumerate( dcmPaths ):
+            inFlight.acquire()
+            pathQueue.put( (dcmIdx, dcmPath) )
+
+    finally:
+        # one sentinel per worker, even if the paths couldn't all be fed
+        for i in xrange(numWorkers):
+            pathQueue.put( None )
+
+
+
+#------------------------------------------------------------------------------------------------
+# a series' database row - a compact, read-only record with access to its values by column name
+# (as attributes or items), by index, or by DICOM tag for 'in' checks - e.g. to compute storage paths
+class SeriesRecord(object):
+    __slots__ = ( 'fieldIndexes', 'values' )
+
+    # no source path, like pydicom objects read from files have
+    path = None
+
+    #--------------------------------------------------------------------------------------------
+    # instantiation - the field indexes map column names and DICOM tags to indexes in the row's values,
+    # and are shared by all records of a query
+    def __init__ ( self, fieldIndexes, values ):
+        self.fieldIndexes = fieldIndexes
+        self.values = values
+
+    #--------------------------------------------------------------------------------------------
+    # gets a value by column name, or by the other names pydicom accepts for its tag (e.g. ManufacturersModelName)
+    def __getattr__ ( self, name ):
+        fieldIdx = self.fieldIndexes.get(name)
+        if fieldIdx is None:
+            fieldIdx = self.fieldIndexes.get( dicom.datadict.tag_for_name(name) )
+            if fieldIdx is None:
+                raise AttributeError(name)
+        return self.values[fieldIdx]
+
+    #--------------------------------------------------------------------------------------------
+    # gets a value by column name or index
+    def __getitem__ ( self, key ):
+        if isinstance(key, (int, long)):
+            return self.values[key]
+        return self.values[ self.fieldIndexes[key] ]
+
+    #--------------------------------------------------------------------------------------------
+    # checks if the record has a value for a DICOM tag or column name
+    def __contains__ ( self, key ):
+        fieldIdx = self.fieldIndexes.get(key)
+        if fieldIdx is None:
+            return False
+        value = self.values[fieldIdx]
+        return value is not None and value != ''
+
+    #--------------------------------------------------------------------------------------------
+    # gets a value by column name, with a default if the record has no such column
+    def get ( self, key, default=None ):
+        fieldIdx = self.fieldIndexes.get(key)
+        if fieldIdx is None:
+            return default
+        return self.values[fieldIdx]
+
+    #--------------------------------------------------------------------------------------------
+    # gets the record's column names
+    def keys ( self ):
+        return [ key for key, fieldIdx in sorted( self.fieldIndexes.items(), key=lambda item: item[1] ) if isinstance(key, basestring) ]
+
+    #--------------------------------------------------------------------------------------------
+    # the series' record ID
+    @property
+    def recordID ( self ):
+        return self.values[ self.fieldIndexes['id'] ]
+
+    def __repr__ ( self ):
+        return "<SeriesRecord %s>" % self.recordID
+
+
+
+#------------------------------------------------------------------------------------------------
+# normalizes a DICOM value into ASCII text for the database, e.g. 'Doe^J\xe9' -> 'Doe^J' (multiple values become their list's text)
+def textValue ( value ):
+    if isinstance(value, unicode):
+        return value.encode('ascii', 'ignore')
+    return str(value).translate(None, nonAsciiChars)
+
+
+
+#------------------------------------------------------------------------------------------------
+# normalizes a DICOM value into an integer for the database - None if empty, text if not a single integer
+def integerValue ( value ):
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return textValue(value)
+
+
+
+#------------------------------------------------------------------------------------------------
+# normalizes a DICOM value into a real number for the database - None if empty, text if not a single number
+def realValue ( value ):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return textValue(value)
+
+
+
+#------------------------------------------------------------------------------------------------
+# keeps a DICOM value as read - for tags in storage paths but not recorded, which storage paths are computed from as they are
+def readValue ( value ):
+    return value
+
+
+
+#------------------------------------------------------------------------------------------------
+# a DICOM's header normalized for the database, read like a series' record - unlike those, tags the DICOM has
+# are present even if their value is empty, as a DICOM's own tags are
+class HeaderRecord(SeriesRecord):
+    __slots__ = ( 'path', )
+
+    #--------------------------------------------------------------------------------------------
+    # instantiation - also takes the source path of the DICOM
+    def __init__ ( self, fieldIndexes, values, path ):
+        SeriesRecord.__init__( self, fieldIndexes, values )
+        self.path = path
+
+    #--------------------------------------------------------------------------------------------
+    # checks if the DICOM has a DICOM tag or column name
+    def __contains__ ( self, key ):
+        fieldIdx = self.fieldIndexes.get(key)
+        return fieldIdx is not None and self.values[fieldIdx] is not None
+
+    def __repr__ ( self ):
+        return "<HeaderRecord %s>" % self.path
+
 
 
 class DicomManager:
+
+    # DICOM tags used to compute storage paths, required to be read along with the tags to record
+    storagePathTags = [
+        0x00080018, #SOP Instance UID
+        0x00080020, #Study Date
+        0x00080050, #Accession Number
+        0x00080060, #Modality
+        0x00080070, #Manufacturer
+        0x00080080, #Institution Name
+        0x00081030, #Study Description
+        0x0008103e, #Series Description
+        0x00081090, #Manufacturer's Model Name
+        0x00100010, #Patient's Name
+        0x00100020, #Patient ID
+        0x00100040, #Patient's Sex
+        0x00101010, #Patient's Age
+        0x00181000, #Device Serial Number
+        0x00181030, #Protocol Name
+        0x0020000e  #Series Instance UID
+    ]
+
+    # DICOM tags recorded per instance, required to be read along with the tags to record
+    instanceTags = [
+        0x00080018, #SOP Instance UID
+        0x00200013  #Instance Number
+    ]
+
+    # database schema migrations, in order - the schema version is the number of migrations applied
+    schemaMigrations = [
+        'migrateSeriesIndexes',
+        'migrateNotesSeriesUidType',
+        'migrateIngestLedger',
+        'migrateInstances',
+        'migrateBlobs',
+        'migrateNoteTags',
+        'migrateSeriesSearch',
+        'migrateStats',
+        'migrateAgeInDays',
+        'migrateSeriesColumnTypes',
+        'migrateBackfills',
+        'migrateTreeChecks',
+        'migrateBackfillSeries'
+    ]
     
     #--------------------------------------------------------------------------------------------
     # instantiation
     def __init__ ( self, init=True ):
 
+        # cache of series' record IDs by SeriesInstanceUID
+        self.seriesIdCache = {}
+
+        # cache of series' storage directories by SeriesInstanceUID
+        self.seriesDirCache = {}
+
+        # whether the database has the full-text search index of series
+        self.seriesSearch = False
+
         if init:
             self.settings = settings.DicomManagerSettings()
             self.init()
@@ -62,8 +328,8 @@ class DicomManager:
         if qResult is None:
             # series table doesn't exist - create table in database
             print "Database table '%s' not found. Creating it..." % self.settings.dbTblSeries
-            dcmHeaderNames = [ DicomDictionary[dcmHeaderKey][4] for dcmHeaderKey in self.settings.tagsToRecord ]
-            qCreate = "CREATE TABLE " + self.settings.dbTblSeries + " ( id INTEGER PRIMARY KEY, NumberOfDicoms INTEGER DEFAULT 0 NOT NULL, " +  ' TEXT, '.join(dcmHeaderNames) + " TEXT )"
+            colDefs = [ '%s %s' % colDef for colDef in zip( self.seriesColumns(), self.seriesColumnTypes() ) ]
+            qCreate = "CREATE TABLE " + self.settings.dbTblSeries + " ( id INTEGER PRIMARY KEY, NumberOfDicoms INTEGER DEFAULT 0 NOT NULL, " + ', '.join(colDefs) + " )"
             with self.dbCon:
                 dbCur = self.dbCon.cursor()
                 dbCur.execute(qCreate)
@@ -78,12 +344,25 @@ class DicomManager:
         if qResult is None:
             # projects table doesn't exist - create table in database
             print "Database table '%s' not found. Creating it..." % self.settings.dbTblSeriesNotes
-            qCreate = ("CREATE TABLE %s ( id INTEGER PRIMARY KEY, SeriesInstanceUID INTEGER, Note TEXT ); "
+            qCreate = ("CREATE TABLE %s ( id INTEGER PRIMARY KEY, SeriesInstanceUID TEXT, Note TEXT ); "
                        "CREATE INDEX SeriesInstanceUidIdx ON %s (SeriesInstanceUID); "
                        ) % ( self.settings.dbTblSeriesNotes, self.settings.dbTblSeriesNotes )
             with self.dbCon:
                 dbCur = self.dbCon.cursor()
                 dbCur.executescript(qCreate)
+
+        # add columns for tags added to the tags to record since the series table was created - before upgrading
+        # the database schema, whose migrations work on the recorded columns
+        self.addSeriesColumns()
+
+        # upgrade database schema
+        self.migrate()
+
+        # check if the full-text search index of series exists (needs SQLite's FTS5 extension)
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "SELECT name FROM sqlite_master WHERE type='table' AND name='%s'" % self.settings.dbTblSeriesSearch )
+            self.seriesSearch = dbCur.fetchone() is not None
     
         # check root directory's existence
         if not os.path.exists(self.settings.rootDir):
@@ -98,54 +377,554 @@ class DicomManager:
 
 
     #--------------------------------------------------------------------------------------------
-    # finds file paths to DICOM files under the given directory
-    def find ( self, dir, recursive=True ):
-        dicoms=[]
+    # upgrades the database schema by applying the migrations it hasn't had yet - raises the error of a failed migration
+    def migrate ( self ):
 
-        # make local refs for speed
-        os_path_join = os.path.join
-        os_path_isfile = os.path.isfile
-        os_path_isdir = os.path.isdir
+        # check the schema version of the database
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( version INTEGER NOT NULL )" % self.settings.dbTblSchemaVersion )
+            dbCur.execute( "SELECT MAX(version) FROM %s" % self.settings.dbTblSchemaVersion )
+            schemaVersion = dbCur.fetchone()[0] or 0
+
+        # apply migrations - each in its own transaction, which sqlite3 would otherwise commit before any schema change
+        isolationLevel = self.dbCon.isolation_level
+        self.dbCon.isolation_level = None
+        try:
+            for version in xrange(schemaVersion + 1, len(self.schemaMigrations) + 1):
+                print "Migrating database to schema version %d..." % version
+                dbCur = self.dbCon.cursor()
+                dbCur.execute( "BEGIN" )
+                try:
+                    getattr(self, self.schemaMigrations[version - 1])(dbCur)
+                    dbCur.execute( "INSERT INTO %s ( version ) VALUES ( ? )" % self.settings.dbTblSchemaVersion, (version,) )
+                except Exception, e:
+                    # stop here - the manager can't work with a partly upgraded schema
+                    dbCur.execute( "ROLLBACK" )
+                    print repr(e)
+                    print "Database migration to schema version %d failed!" % version
+                    raise
+                dbCur.execute( "COMMIT" )
+
+        finally:
+            self.dbCon.isolation_level = isolationLevel
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - makes SeriesInstanceUID unique and indexes the series table's lookup columns
+    def migrateSeriesIndexes ( self, dbCur ):
+        tblSeries = self.settings.dbTblSeries
+
+        # merge any duplicate series records into the first one recorded
+        dbCur.execute( ("UPDATE %s SET NumberOfDicoms = ( SELECT SUM(NumberOfDicoms) FROM %s AS Duplicate WHERE Duplicate.SeriesInstanceUID = %s.SeriesInstanceUID ) "
+                        "WHERE id IN ( SELECT MIN(id) FROM %s GROUP BY SeriesInstanceUID HAVING COUNT(*) > 1 )"
+                        ) % ( tblSeries, tblSeries, tblSeries, tblSeries ) )
+        dbCur.execute( ("DELETE FROM %s WHERE SeriesInstanceUID IS NOT NULL "
+                        "AND id NOT IN ( SELECT MIN(id) FROM %s GROUP BY SeriesInstanceUID )"
+                        ) % ( tblSeries, tblSeries ) )
+
+        # create indexes
+        dbCur.execute( "CREATE UNIQUE INDEX IF NOT EXISTS %sSeriesInstanceUidIdx ON %s (SeriesInstanceUID)" % ( tblSeries, tblSeries ) )
+        self.createSeriesIndexes(dbCur)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - stores notes' SeriesInstanceUID as text rather than integer
+    def migrateNotesSeriesUidType ( self, dbCur ):
+        tblNotes = self.settings.dbTblSeriesNotes
+
+        # check the declared column type
+        dbCur.execute( "PRAGMA table_info(%s)" % tblNotes )
+        colTypes = dict( (row[1], row[2]) for row in dbCur.fetchall() )
+        if colTypes.get('SeriesInstanceUID', 'TEXT').upper() == 'TEXT':
+            return
+
+        # rebuild the notes table with the right column type
+        dbCur.execute( "CREATE TABLE %sMigration ( id INTEGER PRIMARY KEY, SeriesInstanceUID TEXT, Note TEXT )" % tblNotes )
+        dbCur.execute( "INSERT INTO %sMigration ( id, SeriesInstanceUID, Note ) SELECT id, CAST(SeriesInstanceUID AS TEXT), Note FROM %s" % ( tblNotes, tblNotes ) )
+        dbCur.execute( "DROP TABLE %s" % tblNotes )
+        dbCur.execute( "ALTER TABLE %sMigration RENAME TO %s" % ( tblNotes, tblNotes ) )
+        dbCur.execute( "CREATE INDEX SeriesInstanceUidIdx ON %s (SeriesInstanceUID)" % tblNotes )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the ledger of managed source files, used to skip unchanged files when managing again
+    def migrateIngestLedger ( self, dbCur ):
+        tblLedger = self.settings.dbTblIngestLedger
+        dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( SourcePath TEXT PRIMARY KEY, FileSize INTEGER, ModifiedTime REAL, Inode INTEGER, SeriesInstanceUID TEXT )" % tblLedger )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sSeriesInstanceUidIdx ON %s (SeriesInstanceUID)" % ( tblLedger, tblLedger ) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the table of stored DICOM instances
+    def migrateInstances ( self, dbCur ):
+        tblInstances = self.settings.dbTblInstances
+        dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( id INTEGER PRIMARY KEY, SOPInstanceUID TEXT, SeriesId INTEGER, InstanceNumber INTEGER, StoragePath TEXT, FileSize INTEGER, TransferSyntaxUID TEXT )" % tblInstances )
+        dbCur.execute( "CREATE UNIQUE INDEX IF NOT EXISTS %sSOPInstanceUidIdx ON %s (SOPInstanceUID)" % ( tblInstances, tblInstances ) )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sSeriesIdIdx ON %s (SeriesId)" % ( tblInstances, tblInstances ) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the table of content-addressed blobs, referenced by stored instances
+    def migrateBlobs ( self, dbCur ):
+        tblInstances = self.settings.dbTblInstances
+        dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( Hash TEXT PRIMARY KEY, FileSize INTEGER, RefCount INTEGER DEFAULT 0 NOT NULL )" % self.settings.dbTblBlobs )
+        dbCur.execute( "ALTER TABLE %s ADD COLUMN BlobHash TEXT" % tblInstances )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sBlobHashIdx ON %s (BlobHash)" % ( tblInstances, tblInstances ) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the table of hashtags parsed from series notes, and fills it from the existing notes
+    def migrateNoteTags ( self, dbCur ):
+        tblNoteTags = self.settings.dbTblNoteTags
+        dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( NoteId INTEGER NOT NULL, SeriesInstanceUID TEXT, Tag TEXT NOT NULL, Value TEXT )" % tblNoteTags )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sTagIdx ON %s (Tag, Value, SeriesInstanceUID)" % ( tblNoteTags, tblNoteTags ) )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sSeriesInstanceUidIdx ON %s (SeriesInstanceUID, Tag)" % ( tblNoteTags, tblNoteTags ) )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sNoteIdIdx ON %s (NoteId)" % ( tblNoteTags, tblNoteTags ) )
+
+        # parse existing notes
+        dbCur.execute( "SELECT id, SeriesInstanceUID, Note FROM %s" % self.settings.dbTblSeriesNotes )
+        noteTags = []
+        for noteId, seriesInstanceUID, note in dbCur.fetchall():
+            for tag, value in self.noteTags(note):
+                noteTags.append( (noteId, seriesInstanceUID, tag, value) )
+        dbCur.executemany( "INSERT INTO %s ( NoteId, SeriesInstanceUID, Tag, Value ) VALUES ( ?, ?, ?, ? )" % tblNoteTags, noteTags )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the full-text search index of series' descriptions and notes, and fills it
+    def migrateSeriesSearch ( self, dbCur ):
+        cols = self.settings.dbSearchColumns + ['Notes']
+        try:
+            dbCur.execute( "CREATE VIRTUAL TABLE %s USING fts5( %s )" % ( self.settings.dbTblSeriesSearch, ', '.join(cols) ) )
+        except sqlite3.OperationalError, e:
+            print repr(e)
+            print "SQLite FTS5 extension not available. Series search disabled."
+            return
+        dbCur.execute( self.seriesSearchInsert(dbCur) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # builds the query filling the full-text search index from the series table, optionally for a list of SeriesInstanceUIDs
+    def seriesSearchInsert ( self, dbCur, numSeries=None ):
+        tblSeries = self.settings.dbTblSeries
+        tblNotes = self.settings.dbTblSeriesNotes
+
+        # search columns not in the series table are left empty
+        seriesCols = self.tableColumns( dbCur, tblSeries )
+        cols = self.settings.dbSearchColumns
+        values = [ col if col in seriesCols else 'NULL' for col in cols ]
+
+        query = ( "INSERT INTO %s ( rowid, %s, Notes ) SELECT id, %s, ( SELECT group_concat(Note, ' ') FROM %s WHERE %s.SeriesInstanceUID = %s.SeriesInstanceUID ) FROM %s"
+                  ) % ( self.settings.dbTblSeriesSearch, ', '.join(cols), ', '.join(values), tblNotes, tblNotes, tblSeries, tblSeries )
+        if numSeries is not None:
+            query += " WHERE SeriesInstanceUID IN ( %s )" % ', '.join([ '?' for i in xrange(numSeries) ])
+        return query
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # updates the full-text search index for the given series, after recording them or noting them
+    def updateSeriesSearch ( self, dbCur, seriesUIDs ):
+        if not self.seriesSearch:
+            return
+
+        # delete and re-insert index entries in chunks
+        chunkSize = 500
+        for chunkIdx in xrange(0, len(seriesUIDs), chunkSize):
+            chunk = seriesUIDs[chunkIdx:chunkIdx + chunkSize]
+            params = ', '.join([ '?' for i in xrange(len(chunk)) ])
+            dbCur.execute( "DELETE FROM %s WHERE rowid IN ( SELECT id FROM %s WHERE SeriesInstanceUID IN ( %s ) )" % ( self.settings.dbTblSeriesSearch, self.settings.dbTblSeries, params ), chunk )
+            dbCur.execute( self.seriesSearchInsert( dbCur, len(chunk) ), chunk )
 
-        # progress
-        sys.stdout.write( " Searching...\r" )
-        sys.stdout.flush()
 
-        # loop through directory listings
-        for listing in os.listdir(dir):
 
-            # get full path of listing
-            fullPath = os_path_join(dir, listing)
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the summary statistics table, and fills it from the series table
+    def migrateStats ( self, dbCur ):
+        dbCur.execute( ("CREATE TABLE IF NOT EXISTS %s ( Dimension TEXT NOT NULL, Value TEXT NOT NULL, "
+                        "NumberOfSeries INTEGER DEFAULT 0 NOT NULL, NumberOfDicoms INTEGER DEFAULT 0 NOT NULL, "
+                        "NumberOfStudies INTEGER DEFAULT 0 NOT NULL, NumberOfPatients INTEGER DEFAULT 0 NOT NULL, "
+                        "PRIMARY KEY ( Dimension, Value ) )") % self.settings.dbTblStats )
+        self.rebuildStats(dbCur)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - adds the patients' age in days at scan time to the series table, indexed, and computes it for the recorded series
+    def migrateAgeInDays ( self, dbCur ):
+        tblSeries = self.settings.dbTblSeries
+        dbCur.execute( "ALTER TABLE %s ADD COLUMN AgeInDays INTEGER" % tblSeries )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sAgeInDaysIdx ON %s (AgeInDays)" % ( tblSeries, tblSeries ) )
+
+        # compute ages from the recorded dates and ages
+        seriesCols = self.tableColumns( dbCur, tblSeries )
+        ageCols = [ colName if colName in seriesCols else 'NULL' for colName in ('StudyDate', 'PatientBirthDate', 'PatientAge') ]
+        dbCur.execute( "SELECT id, %s FROM %s" % ( ', '.join(ageCols), tblSeries ) )
+        ages = []
+        for row in dbCur.fetchall():
+            ageInDays = self.ageInDays( row[1], row[2], row[3] )
+            if ageInDays is not None:
+                ages.append( (ageInDays, row[0]) )
+        dbCur.executemany( "UPDATE %s SET AgeInDays = ? WHERE id = ?" % tblSeries, ages )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - stores the series table's numeric DICOM values as numbers (REAL or INTEGER, by value representation)
+    # rather than text, rebuilding the table in place
+    def migrateSeriesColumnTypes ( self, dbCur ):
+        tblSeries = self.settings.dbTblSeries
+
+        # check the declared column types
+        dbCur.execute( "PRAGMA table_info(%s)" % tblSeries )
+        colDefs = [ [ row[1], row[2] ] for row in dbCur.fetchall() ]
+        colTypes = dict( zip( self.seriesColumns(), self.seriesColumnTypes() ) )
+        changed = False
+        for colDef in colDefs:
+            colType = colTypes.get( colDef[0] )
+            if colType is not None and colType != colDef[1].upper():
+                colDef[1] = colType
+                changed = True
+        if not changed:
+            return
+
+        # rebuild the series table with the new column types - numeric text is converted on insert
+        colNames = ', '.join([ colName for colName, colType in colDefs ])
+        colDefs = [ '%s %s' % ( colName, colType ) for colName, colType in colDefs if colName not in ('id', 'NumberOfDicoms') ]
+        dbCur.execute( "CREATE TABLE %sMigration ( id INTEGER PRIMARY KEY, NumberOfDicoms INTEGER DEFAULT 0 NOT NULL, %s )" % ( tblSeries, ', '.join(colDefs) ) )
+        dbCur.execute( "INSERT INTO %sMigration ( %s ) SELECT %s FROM %s" % ( tblSeries, colNames, colNames, tblSeries ) )
+        dbCur.execute( "DROP TABLE %s" % tblSeries )
+        dbCur.execute( "ALTER TABLE %sMigration RENAME TO %s" % ( tblSeries, tblSeries ) )
+
+        # recreate indexes
+        dbCur.execute( "CREATE UNIQUE INDEX IF NOT EXISTS %sSeriesInstanceUidIdx ON %s (SeriesInstanceUID)" % ( tblSeries, tblSeries ) )
+        dbCur.execute( "CREATE INDEX IF NOT EXISTS %sAgeInDaysIdx ON %s (AgeInDays)" % ( tblSeries, tblSeries ) )
+        self.createSeriesIndexes(dbCur)
+
+        # numbers summarize as different text than before
+        self.rebuildStats(dbCur)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the table of series table columns added for existing series, until they're filled by backfill()
+    def migrateBackfills ( self, dbCur ):
+        dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( ColumnName TEXT PRIMARY KEY )" % self.settings.dbTblBackfills )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the table of series directories found by the last check of the managed filetree
+    def migrateTreeChecks ( self, dbCur ):
+        dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( SeriesDir TEXT PRIMARY KEY, ModifiedTime REAL, NumberOfDicoms INTEGER )" % self.settings.dbTblTreeChecks )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # migration - creates the table of the series yet to be backfilled per column, listing the series without values in the
+    # columns waiting to be backfilled (as backfill() told them apart before the table)
+    def migrateBackfillSeries ( self, dbCur ):
+        tblBackfillSeries = self.settings.dbTblBackfillSeries
+        dbCur.execute( "CREATE TABLE IF NOT EXISTS %s ( ColumnName TEXT NOT NULL, SeriesId INTEGER NOT NULL, PRIMARY KEY ( ColumnName, SeriesId ) )" % tblBackfillSeries )
+
+        seriesCols = set( self.tableColumns( dbCur, self.settings.dbTblSeries ) )
+        dbCur.execute( "SELECT ColumnName FROM %s" % self.settings.dbTblBackfills )
+        for colName in [ row[0] for row in dbCur.fetchall() ]:
+            if colName in seriesCols:
+                dbCur.execute( "INSERT OR IGNORE INTO %s ( ColumnName, SeriesId ) SELECT ?, id FROM %s WHERE %s IS NULL" % ( tblBackfillSeries, self.settings.dbTblSeries, colName ), (colName,) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # adds the series table's missing columns for the tags to record, e.g. after tags were added to the settings,
+    # listing them to be filled for existing series by backfill() - returns the names of the columns added, or raises the error
+    # that kept them from being added
+    def addSeriesColumns ( self ):
+        tblSeries = self.settings.dbTblSeries
+
+        # check the series table's columns
+        with self.dbCon:
+            colNames = set( self.tableColumns( self.dbCon.cursor(), tblSeries ) )
+        newCols = [ colDef for colDef in zip( self.seriesColumns(), self.seriesColumnTypes() ) if colDef[0] not in colNames ]
+        if not newCols:
+            return []
+
+        # add columns in one transaction, which sqlite3 would otherwise commit before each schema change
+        isolationLevel = self.dbCon.isolation_level
+        self.dbCon.isolation_level = None
+        try:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "BEGIN" )
+            try:
+                # the tables of columns to backfill may not have been created by their migrations yet
+                self.migrateBackfills(dbCur)
+                self.migrateBackfillSeries(dbCur)
+                for colName, colType in newCols:
+                    print "Adding column '%s' to database table '%s'..." % ( colName, tblSeries )
+                    dbCur.execute( "ALTER TABLE %s ADD COLUMN %s %s" % ( tblSeries, colName, colType ) )
+                    dbCur.execute( "INSERT OR IGNORE INTO %s ( ColumnName ) VALUES ( ? )" % self.settings.dbTblBackfills, (colName,) )
+                    dbCur.execute( "INSERT OR IGNORE INTO %s ( ColumnName, SeriesId ) SELECT ?, id FROM %s" % ( self.settings.dbTblBackfillSeries, tblSeries ), (colName,) )
+                self.createSeriesIndexes(dbCur)
+
+                # count the recorded series under the new columns' summary statistics, without values yet - unless the
+                # statistics table is yet to be created (and built) by its migration
+                dbCur.execute( "SELECT name FROM sqlite_master WHERE type='table' AND name='%s'" % self.settings.dbTblStats )
+                if dbCur.fetchone() is not None and set( colName for colName, colType in newCols ) & set( self.statsColumns() ):
+                    self.rebuildStats(dbCur)
+            except Exception, e:
+                dbCur.execute( "ROLLBACK" )
+                print repr(e)
+                print "Columns could not be added to database table '%s'!" % tblSeries
+                raise
+            dbCur.execute( "COMMIT" )
+
+        finally:
+            self.dbCon.isolation_level = isolationLevel
+
+        return [ colName for colName, colType in newCols ]
 
-            # check if listing is a file
-            if os_path_isfile(fullPath):
 
-                # check if listing is DICOM
-                if listing.endswith(('.dcm', '.dicom')):
 
-                    # adds it to the dicoms list
-                    dicoms.append(fullPath)
+    #--------------------------------------------------------------------------------------------
+    # gets the names of a database table's columns, as they are in the database rather than in the settings
+    # (from an empty query rather than PRAGMA table_info, which sqlite3 would commit an open transaction before)
+    def tableColumns ( self, dbCur, tblName ):
+        dbCur.execute( "SELECT * FROM %s LIMIT 0" % tblName )
+        return [ column[0] for column in dbCur.description ]
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # creates the secondary indexes on the series table listed in the settings (a column, or a tuple of columns),
+    # skipping indexes on columns the table doesn't have
+    def createSeriesIndexes ( self, dbCur ):
+        tblSeries = self.settings.dbTblSeries
+        seriesCols = set( self.tableColumns( dbCur, tblSeries ) )
+        for colNames in self.settings.dbSeriesIndexes:
+            if isinstance(colNames, basestring):
+                colNames = (colNames,)
+            if not seriesCols.issuperset(colNames):
+                continue
+            dbCur.execute( "CREATE INDEX IF NOT EXISTS %s%sIdx ON %s (%s)" % ( tblSeries, ''.join(colNames), tblSeries, ', '.join(colNames) ) )
+
 
-            # check if should search subdirectories
-            if recursive:
 
-                # check if listing is a directory
-                if os_path_isdir(fullPath):
+    #--------------------------------------------------------------------------------------------
+    # finds file paths to DICOM files under the given directory
+    def find ( self, dir, recursive=True ):
+
+        # progress
+        sys.stdout.write( " Searching...\r" )
+        sys.stdout.flush()
 
-                    # recursive call to search subdirectory
-                    dicoms.extend( self.find(fullPath, True) )
+        dicoms = list( self.iterFind(dir, recursive) )
 
         # progress
         sys.stdout.write( "                   \r" )
         sys.stdout.flush()
 
         return dicoms
-        
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # lazily finds file paths to DICOM files under the given directory, in the same order as find
+    def iterFind ( self, dir, recursive=True, sniff=None ):
+
+        # option - check the content of files without a DICOM extension
+        if sniff is None:
+            sniff = self.settings.findSniff
+        sniffNoPreamble = self.settings.findSniffNoPreamble
+        dcmExtensions = tuple( self.settings.findExtensions )
+
+        # option - list the instances of directories with a DICOMDIR index instead of searching them
+        useDicomDir = self.settings.findUseDicomDir
+        if useDicomDir:
+            dicomDirPaths = self.readDicomDir( os.path.join(dir, 'DICOMDIR') )
+            if dicomDirPaths is not None:
+                for dcmPath in dicomDirPaths:
+                    yield dcmPath
+                return
+
+        # walk directories depth-first with a stack of listings rather than recursion
+        listings = [ (dir, self.listDir(dir)) ]
+        while listings:
+
+            # get next listing of the current directory
+            try:
+                name, fullPath, isFile, isDir = next(listings[-1][1])
+            except StopIteration:
+                listings.pop()
+                continue
+            except OSError, e:
+                print repr(e)
+                print "Directory could not be searched: %s" % listings.pop()[0]
+                continue
+
+            # check if listing is DICOM
+            if isFile:
+                if name.endswith(dcmExtensions):
+                    yield fullPath
+                elif sniff and name != 'DICOMDIR' and self.isDicom(fullPath, sniffNoPreamble):
+                    yield fullPath
+
+            # check if should search subdirectory
+            elif isDir and recursive:
+
+                # check for DICOMDIR index
+                if useDicomDir:
+                    dicomDirPaths = self.readDicomDir( os.path.join(fullPath, 'DICOMDIR') )
+                    if dicomDirPaths is not None:
+                        for dcmPath in dicomDirPaths:
+                            yield dcmPath
+                        continue
+
+                listings.append( (fullPath, self.listDir(fullPath)) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # checks whether a file is DICOM by reading its 128-byte preamble and 'DICM' prefix, optionally probing files without preamble
+    def isDicom ( self, path, noPreamble=False ):
+
+        # read the start of the file
+        try:
+            with open(path, 'rb') as dcmFile:
+                header = dcmFile.read(132)
+        except IOError:
+            return False
+
+        # DICOM part 10 file
+        if header[128:132] == 'DICM':
+            return True
+
+        # option - file without preamble starting with a little endian file meta or identifying group element
+        if noPreamble and len(header) >= 8:
+            group, element = struct.unpack('<HH', header[:4])
+            if group in (0x0002, 0x0008) and element < 0x1000:
+
+                # explicit VR, or implicit VR with a value length shorter than what was read
+                if header[4:6] in dicomVRs or struct.unpack('<I', header[4:8])[0] < len(header):
+                    return True
+
+        return False
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets file paths to the DICOM instances indexed by a DICOMDIR file, without opening them
+    def readDicomDir ( self, dicomDirPath ):
+
+        # check that the DICOMDIR exists
+        if not os.path.isfile(dicomDirPath):
+            return None
+
+        # read DICOMDIR
+        try:
+            dicomDir = dicom.read_dicomdir(dicomDirPath)
+        except Exception, e:
+            print repr(e)
+            print "DICOMDIR could not be read: %s" % dicomDirPath
+            return None
+
+        # collect referenced files, relative to the DICOMDIR's directory
+        dicomDirRoot = os.path.dirname(dicomDirPath)
+        dcmPaths = []
+        for dirRecord in dicomDir.DirectoryRecordSequence:
+            if 'ReferencedFileID' in dirRecord:
+                fileID = dirRecord.ReferencedFileID
+                if isinstance(fileID, basestring):
+                    fileID = [ fileID ]
+                dcmPaths.append( os.path.join( dicomDirRoot, *fileID ) )
+
+        return dcmPaths
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # lists a directory as ( name, full path, is file, is directory ), using the listing's file types when available
+    def listDir ( self, dir ):
+
+        # directory entries know their type on most filesystems, avoiding a stat per listing
+        if scandir is not None:
+            for entry in scandir(dir):
+                yield entry.name, entry.path, entry.is_file(), entry.is_dir()
+
+        # otherwise, a single stat per listing
+        else:
+            os_path_join = os.path.join
+            os_stat = os.stat
+            for name in os.listdir(dir):
+                fullPath = os_path_join(dir, name)
+                try:
+                    mode = os_stat(fullPath).st_mode
+                except OSError:
+                    continue
+                yield name, fullPath, stat.S_ISREG(mode), stat.S_ISDIR(mode)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the set of DICOM tags the manager uses, i.e. those recorded and those in storage paths
+    def headerTags ( self ):
+
+        # compute once per manager
+        if getattr(self, 'headerTagSet', None) is None:
+            self.headerTagSet = frozenset( self.settings.tagsToRecord + self.storagePathTags + self.instanceTags )
+
+        return self.headerTagSet
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the names of the series table's columns holding the recorded DICOM tags
+    def seriesColumns ( self ):
+
+        # compute once per manager
+        if getattr(self, 'seriesColumnNames', None) is None:
+            self.seriesColumnNames = [ DicomDictionary[dcmHeaderTag][4] for dcmHeaderTag in self.settings.tagsToRecord ]
+
+        return self.seriesColumnNames
+
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the SQLite types of the series table's columns holding the recorded DICOM tags, by their value representation:
+    # REAL or INTEGER for single numbers, TEXT for anything else
+    def seriesColumnTypes ( self ):
+
+        # compute once per manager
+        if getattr(self, 'seriesColumnTypeNames', None) is None:
+            self.seriesColumnTypeNames = []
+            for dcmHeaderTag in self.settings.tagsToRecord:
+                vr, vm = DicomDictionary[dcmHeaderTag][:2]
+                colTypes = set( numericVRTypes.get(tagVR) for tagVR in vr.split(' or ') )
+                if vm == '1' and len(colTypes) == 1 and None not in colTypes:
+                    self.seriesColumnTypeNames.append( colTypes.pop() )
+                else:
+                    self.seriesColumnTypeNames.append( 'TEXT' )
+
+        return self.seriesColumnTypeNames
+
 
 
     #--------------------------------------------------------------------------------------------
     # reads a given DICOM file to create a modified pydicom object
-    def read ( self, dcmPath ):
+    def read ( self, dcmPath, headerOnly=None ):
+
+        # option - read only header tags used by the manager
+        if headerOnly is None:
+            headerOnly = self.settings.readHeaderOnly
         
         # check that the dicom exists
         if not os.path.isfile(dcmPath):
@@ -155,12 +934,22 @@ class DicomManager:
         # read dicom file
         dcm = None
         try:
-            dcm = dicom.read_file(dcmPath)
+            if headerOnly:
+                # stop before pixel data and leave large values in the file until accessed
+                dcm = dicom.read_file(dcmPath, defer_size=self.settings.readDeferSize, stop_before_pixels=True)
+            else:
+                dcm = dicom.read_file(dcmPath)
         except Exception, e:
             print repr(e)
             print "DICOM could not be read: %s" % dcmPath
             return None
 
+        # drop tags the manager doesn't use, so they're never converted from raw values
+        if headerOnly:
+            headerTags = self.headerTags()
+            for dcmTag in [ dcmTag for dcmTag in dcm.keys() if dcmTag not in headerTags ]:
+                del dcm[dcmTag]
+
         # check if DICOM has require tags
         if (0x00100020 not in dcm) or (not dcm.PatientID):
             print "DICOM doesn't have PatientID. Refusing to read: %s" % dcmPath
@@ -178,9 +967,6 @@ class DicomManager:
             print "DICOM doesn't have SOPInstanceUID. Refusing to read: %s" % dcmPath
             return None
 
-        # sanitize
-        dcm = self.sanitizeDicom(dcm)
-
         # save DICOM source path
         dcm.path = dcmPath
 
@@ -192,26 +978,178 @@ class DicomManager:
 
 
     #--------------------------------------------------------------------------------------------
-    # removes non-ascii characters from a pydicom object's header data
-    def sanitizeDicom ( self, dcm ):
+    # reads given DICOM files, in parallel worker processes if requested, yielding ( path, pydicom object ) in order
+    def iterRead ( self, dcmPaths, numWorkers=1, headerOnly=None ):
 
-        # loop through DICOM tags we intend to record
-        for dcmHeaderTag in self.settings.tagsToRecord:
+        # serial reading
+        if numWorkers <= 1:
+            for dcmPath in dcmPaths:
+                yield dcmPath, self.read(dcmPath, headerOnly)
+            return
 
-            # check if tag is present
-            if dcmHeaderTag in dcm:
+        # bounded queues and in-flight count give backpressure on the file reading
+        queueSize = self.settings.manageQueueSize
+        pathQueue = multiprocessing.Queue(queueSize)
+        dcmQueue = multiprocessing.Queue(queueSize)
+        inFlight = threading.Semaphore(queueSize)
+
+        # start worker processes
+        workers = []
+        for i in xrange(numWorkers):
+            worker = multiprocessing.Process( target=readWorker, args=(self.settings, pathQueue, dcmQueue, headerOnly) )
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        # start feeding paths to the workers
+        feeder = threading.Thread( target=feedPaths, args=(dcmPaths, pathQueue, inFlight, numWorkers) )
+        feeder.daemon = True
+        feeder.start()
 
+        try:
+            # collect read DICOMs until all workers are done, yielding them in the order given
+            pending = {}
+            nextIdx = 0
+            numDone = 0
+            while numDone < numWorkers:
                 try:
-                    # enforce single ascii string
-                    dcm[dcmHeaderTag].value = "".join(i for i in ( str(dcm[dcmHeaderTag].value) ) if ord(i)<128)
-                except Exception, e:
-                    print repr(e)
-                    print "DICOM could not be sanitized"
-                    print dcm[dcmHeaderTag]
-                    print dcm[dcmHeaderTag].value
-                    return None
-                
-        return dcm
+                    item = dcmQueue.get(timeout=1)
+                except Queue.Empty:
+                    # check that workers haven't died
+                    if not any( worker.is_alive() for worker in workers ):
+                        print "DICOM reading workers exited unexpectedly."
+                        break
+                    continue
+
+                if item is None:
+                    numDone += 1
+                    continue
+
+                dcmIdx, dcmPath, dcm = item
+                pending[dcmIdx] = (dcmPath, dcm)
+                while nextIdx in pending:
+                    dcmPath, dcm = pending.pop(nextIdx)
+                    nextIdx += 1
+                    inFlight.release()
+                    yield dcmPath, dcm
+
+        finally:
+            # stop any workers still running (e.g. if the caller stopped early)
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the converters normalizing the values of the tags to record for the database, one per tag chosen by its VR
+    # (as its column's type), followed by ones keeping the values of storage path tags not recorded as read -
+    # along with the field indexes of normalized headers
+    def headerNormalizers ( self ):
+
+        # compute once per manager
+        if getattr(self, 'headerConverters', None) is None:
+            typeConverters = { 'INTEGER': integerValue, 'REAL': realValue, 'TEXT': textValue }
+            self.headerConverters = []
+            self.headerFieldIndexes = {}
+            for fieldIdx, ( dcmHeaderTag, tagName, colType ) in enumerate( zip( self.settings.tagsToRecord, self.seriesColumns(), self.seriesColumnTypes() ) ):
+                if DicomDictionary[dcmHeaderTag][0] == 'SQ':
+                    self.headerConverters.append( ( dcmHeaderTag, self.encodeSequence ) )
+                else:
+                    self.headerConverters.append( ( dcmHeaderTag, typeConverters[colType] ) )
+                self.headerFieldIndexes[ dcmHeaderTag ] = fieldIdx
+                self.headerFieldIndexes[ tagName ] = fieldIdx
+            for dcmHeaderTag in self.storagePathTags:
+                if dcmHeaderTag not in self.headerFieldIndexes:
+                    self.headerFieldIndexes[ dcmHeaderTag ] = len( self.headerConverters )
+                    self.headerFieldIndexes[ DicomDictionary[dcmHeaderTag][4] ] = len( self.headerConverters )
+                    self.headerConverters.append( ( dcmHeaderTag, readValue ) )
+
+        return self.headerConverters
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # normalizes the values of the tags to record of a DICOM into database values, in the order of the series table's
+    # columns and followed by the values of storage path tags not recorded - without changing the DICOM.
+    # Returns None if a value can't be normalized
+    def normalizeHeader ( self, dcm ):
+        dict_contains = dict.__contains__
+        values = []
+
+        for dcmHeaderTag, convert in self.headerNormalizers():
+            # check the DICOM's tags directly, skipping pydicom's tag conversions for tags it doesn't have
+            if not dict_contains( dcm, dcmHeaderTag ):
+                values.append( None )
+                continue
+            dataElem = dcm[dcmHeaderTag]
+
+            try:
+                values.append( convert( dataElem.value ) )
+            except Exception, e:
+                print repr(e)
+                print "DICOM could not be normalized: %s" % dcm.path
+                print dataElem
+                return None
+
+        return HeaderRecord( self.headerFieldIndexes, tuple(values), dcm.path )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # encodes a DICOM sequence as compact JSON: a list of its items, as objects of their values by keyword
+    # nested sequences deeper than settings.sequenceMaxDepth become their number of items, and items beyond
+    # settings.sequenceMaxSize characters are left out, replaced by a {"truncated": number of items} object
+    def encodeSequence ( self, sequence ):
+        maxSize = self.settings.sequenceMaxSize
+        encodedItems = []
+        size = 2
+        for itemIdx, item in enumerate( sequence ):
+            encodedItem = json.dumps( self.sequenceItem(item, 1), separators=(',', ':') )
+            if maxSize is not None and size + len(encodedItem) + 1 > maxSize:
+                encodedItems.append( json.dumps( { 'truncated': len(sequence) - itemIdx }, separators=(',', ':') ) )
+                break
+            encodedItems.append( encodedItem )
+            size += len(encodedItem) + 1
+        return '[' + ','.join(encodedItems) + ']'
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # converts a sequence item to an ordered dict of its values by keyword (or tag, for private tags), for JSON encoding
+    def sequenceItem ( self, item, depth ):
+        values = collections.OrderedDict()
+        for dataElement in item:
+            if dataElement.VR in binaryVRs:
+                continue
+            dictEntry = DicomDictionary.get( dataElement.tag )
+            key = dictEntry[4] if dictEntry is not None else '%08x' % dataElement.tag
+            if dataElement.VR == 'SQ':
+                if depth < self.settings.sequenceMaxDepth:
+                    values[key] = [ self.sequenceItem(nestedItem, depth + 1) for nestedItem in dataElement.value ]
+                else:
+                    values[key] = len( dataElement.value )
+            else:
+                values[key] = self.sequenceValue( dataElement.value )
+        return values
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # converts a sequence item's value to numbers, text, or lists of them, for JSON encoding
+    def sequenceValue ( self, value ):
+        if isinstance(value, (list, tuple)):
+            return [ self.sequenceValue(subValue) for subValue in value ]
+        if isinstance(value, (int, long)):
+            return int(value)
+        if isinstance(value, float):
+            return float(value)
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return value.decode('utf-8', 'replace')
+        return unicode(value)
 
 
 
@@ -220,6 +1158,50 @@ class DicomManager:
     def storagePath ( self, dcm, directory=False):
         os_path_join = os.path.join
 
+        # check for SeriesInstanceUID
+        if 0x0020000e not in dcm:
+            print "DICOM doesn't have SeriesInstanceUID. Can't generate storage path for file: %s" % dcm.path
+            return None
+
+        # compute the series' storage directory once
+        seriesDir = self.seriesDirCache.get( str(dcm.SeriesInstanceUID) )
+        if seriesDir is None:
+            # from the DICOM's normalized header, or from a series' record
+            if isinstance(dcm, Dataset):
+                header = self.normalizeHeader(dcm)
+                if header is None:
+                    return None
+                seriesDir = self.storageDir(header)
+            else:
+                seriesDir = self.storageDir(dcm)
+            if seriesDir is None:
+                return None
+            self.seriesDirCache[ str(dcm.SeriesInstanceUID) ] = seriesDir
+
+        # option - return storage directory
+        if directory:
+            return seriesDir
+
+        # option - return storage path
+        else:
+
+            # check for SOP Instance UID
+            if 0x00080018 in dcm:
+                imageUID = dcm.SOPInstanceUID.replace('/','')
+            else:
+                print "DICOM doesn't have SOPInstanceUID. Can't generate storage path for file: %s" % dcm.path
+                return None
+
+            # create path, sanitized for unix-based systems
+            return os_path_join( seriesDir, self.sanitizeStoragePath( '%s.dcm' % imageUID.lower() ) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # computes the storage directory of a DICOM's series based on its tags, without caching
+    def storageDir ( self, dcm ):
+        os_path_join = os.path.join
+
         # Checks if DICOM has values in each of the following tags. For certain tags, values are required so 'none' is returned. 
         if 0x00181000 in dcm:
             modality = dcm.Modality.replace('/','')
@@ -313,476 +1295,1884 @@ class DicomManager:
         studyDir = os_path_join( patientDir, studySlug.lower() )
         seriesDir = os_path_join( studyDir, seriesSlug.lower() )
 
-        # option - return storage directory
-        if directory:
-
-            # sanitize path for unix-based systems
-            return self.sanitizeStoragePath(seriesDir)
-
-        # option - return storage path
-        else:
-
-            # check for SOP Instance UID
-            if 0x00080018 in dcm:
-                imageUID = dcm.SOPInstanceUID.replace('/','')
-            else:
-                print "DICOM doesn't have SOPInstanceUID. Can't generate storage path for file: %s" % dcm.path
-                return None
-            
-            # create path
-            dcmPath = os_path_join( seriesDir, '%s.dcm' % imageUID.lower() )
-
-            # sanitize path for unix-based systems
-            return self.sanitizeStoragePath(dcmPath)
+        # sanitize path for unix-based systems
+        return self.sanitizeStoragePath(seriesDir)
 
 
 
     #--------------------------------------------------------------------------------------------
     # removes all special charachters in a path string
     def sanitizeStoragePath ( self, path ):
-             
-        path = path.replace('`','') \
-                .replace('~','') \
-                .replace('!','') \
-                .replace('@','') \
-                .replace('#','') \
-                .replace('$','') \
-                .replace('%','') \
-                .replace('^','') \
-                .replace('&','') \
-                .replace('*','') \
-                .replace('(','') \
-                .replace(')','') \
-                .replace('{','') \
-                .replace('}','') \
-                .replace('[','') \
-                .replace(']','') \
-                .replace('|','') \
-                .replace('\\','') \
-                .replace(':','') \
-                .replace(';','') \
-                .replace("'",'') \
-                .replace('"','') \
-                .replace('<','') \
-                .replace('>','') \
-                .replace(',','') \
-                .replace('?','') \
-                .replace(' ','_')
-        return path
+
+        # remove characters and replace spaces in a single pass
+        if isinstance(path, unicode):
+            return path.translate(storagePathUnicodeTable)
+        return path.translate(storagePathTable, storagePathDeleteChars)
 
 
 
     #--------------------------------------------------------------------------------------------
     # records DICOM series header data into an SQLite database
     def record ( self, dcm ):
-        recordID = None
-        cols = []
-        vals = []
+        return self.recordMany( [dcm] )[0]
+
 
-        # collect column names and values for database entry
-        for dcmHeaderTag in self.settings.tagsToRecord:
-            if dcmHeaderTag in dcm:
-                cols.append( DicomDictionary[dcmHeaderTag][4] )
-                vals.append( dcm[dcmHeaderTag].value )
 
-        # begin databse transaction
+    #--------------------------------------------------------------------------------------------
+    # records the series header data of many DICOMs into an SQLite database in one transaction
+    def recordMany ( self, dcms ):
+        seriesIdCache = self.seriesIdCache
+
+        # check the series known to this manager are still recorded, e.g. not deleted by another connection since
         with self.dbCon:
-            dbCur = self.dbCon.cursor()
-            
-            # try
+            self.refreshSeriesIds( self.dbCon.cursor(), set( str(dcm.SeriesInstanceUID) for dcm in dcms ) )
+
+        # collect series not yet known to this manager, in order of appearance
+        newSeries = []
+        for dcm in dcms:
+            seriesUID = str( dcm.SeriesInstanceUID )
+            if seriesUID not in seriesIdCache:
+                seriesIdCache[seriesUID] = None
+                newSeries.append(dcm)
+
+        # record series in one database transaction - on error, it's rolled back as the error leaves it
+        if newSeries:
             try:
-                # search for series in database
-                qCheck = "SELECT id, SeriesInstanceUID FROM %s WHERE SeriesInstanceUID = ? LIMIT 1" % self.settings.dbTblSeries
-                dbCur.execute( qCheck, (dcm.SeriesInstanceUID,) )
-                qResult = dbCur.fetchone()
-
-                # if series not in database
-                if qResult is None:
-                    # record series header data in database
-                    qInsertSeries = "INSERT INTO %s ( %s ) VALUES ( %s )" % ( self.settings.dbTblSeries, ', '.join(cols), ', '.join([ '?' for i in xrange(len(vals)) ]) )
-                    qSeriesLastInsertId = "SELECT last_insert_rowid()"
-                    dbCur.execute( qInsertSeries, vals)
-                    dbCur.execute( qSeriesLastInsertId )
-                    qResult = dbCur.fetchone()
-
-                recordID = str( qResult[0] )
-
-            # catch
+                with self.dbCon:
+                    dbCur = self.dbCon.cursor()
+
+                    # search for series in database
+                    self.lookupSeriesIds( dbCur, [ str(dcm.SeriesInstanceUID) for dcm in newSeries ] )
+
+                    # collect values for database entries of series not in database
+                    tags = self.settings.tagsToRecord
+                    rows = []
+                    rowSeriesUIDs = []
+                    for dcm in newSeries:
+                        if seriesIdCache[ str(dcm.SeriesInstanceUID) ] is None:
+                            header = self.normalizeHeader(dcm)
+                            if header is None:
+                                seriesIdCache.pop( str(dcm.SeriesInstanceUID) )
+                                print "DICOM could not be recorded: %s" % dcm.path
+                                continue
+                            ageValues = [ header.get(dcmHeaderTag) if dcmHeaderTag in header.fieldIndexes else getattr( dcm.get(dcmHeaderTag), 'value', None ) for dcmHeaderTag in (0x00080020, 0x00100030, 0x00101010) ]
+                            rows.append( header.values[:len(tags)] + ( self.ageInDays(*ageValues), ) )
+                            rowSeriesUIDs.append( str(dcm.SeriesInstanceUID) )
+
+                    # record series header data, and patient age in days, in database
+                    if rows:
+                        cols = self.seriesColumns() + ['AgeInDays']
+                        qInsertSeries = "INSERT INTO %s ( %s ) VALUES ( %s )" % ( self.settings.dbTblSeries, ', '.join(cols), ', '.join([ '?' for i in xrange(len(cols)) ]) )
+                        dbCur.executemany( qInsertSeries, rows )
+                        self.lookupSeriesIds( dbCur, [ str(dcm.SeriesInstanceUID) for dcm in newSeries ] )
+
+                        # index new series for full-text search
+                        self.updateSeriesSearch( dbCur, rowSeriesUIDs )
+
+                        # count new series in the summary statistics
+                        newIds = [ seriesIdCache[seriesUID] for seriesUID in rowSeriesUIDs ]
+                        self.countStats( dbCur, self.selectStats(dbCur, 'id', newIds), 1, frozenset(newIds) )
+
+            # none of the new series were recorded
             except Exception, e:
                 print repr(e)
-                print "DICOM could not be recorded: %s" % dcm.path
-                return None
-        
-        return recordID
-        
+                for dcm in newSeries:
+                    seriesIdCache.pop( str(dcm.SeriesInstanceUID), None )
+                    print "DICOM could not be recorded: %s" % dcm.path
 
+        # assign record IDs
+        recordIDs = []
+        for dcm in dcms:
+            recordID = seriesIdCache.get( str(dcm.SeriesInstanceUID) )
+            if recordID is not None:
+                recordID = str( recordID )
+            dcm.recordID = recordID
+            recordIDs.append( recordID )
 
-    #--------------------------------------------------------------------------------------------
-    # copies a DICOM file into a human-readable filetree
-    def store ( self, dcm ):
-        dcmPath = dcm.path
+        return recordIDs
 
-        # check that the dicom exists
-        if not os.path.isfile(dcmPath):
-            print "Dicom not found: %s" % dcmPath
-            return None
 
-        # determine where to store the DICOM
-        storeDst = self.storagePath(dcm)
-        if storeDst == None:
-            print "Couldn't store DICOM: %s" % dcmPath
-            return None
-        storeDir = os.path.dirname(storeDst)
 
-        # check if directory exists
-        if not os.path.isdir(storeDir):
+    #--------------------------------------------------------------------------------------------
+    # fills columns of recorded series from one stored DICOM per series, read header-only in parallel worker processes -
+    # by default the columns added by init() and not filled for all series yet, for the series they weren't filled for (or, option, for all series)
+    # columns in storage paths are only filled where the series' storage directory stays where its DICOMs are
+    # first records the stored instances of series recorded before their instances were - see backfillInstances
+    # returns the number of series filled
+    def backfill ( self, columns=None, full=False, numWorkers=None ):
+        tblBackfills = self.settings.dbTblBackfills
+        tblBackfillSeries = self.settings.dbTblBackfillSeries
+
+        # number of processes reading DICOMs
+        if numWorkers is None:
+            numWorkers = self.settings.backfillWorkers
+
+        self.backfillInstances( numWorkers )
+
+        # columns to fill
+        if columns is None:
+            with self.dbCon:
+                dbCur = self.dbCon.cursor()
+                dbCur.execute( "SELECT ColumnName FROM %s" % tblBackfills )
+                columns = [ row[0] for row in dbCur.fetchall() ]
+        if not columns:
+            return 0
+        seriesCols = self.seriesColumns()
+        for colName in columns:
+            if colName not in seriesCols:
+                print "Can't backfill series. Column not recorded: %s" % colName
+                return 0
+        colIdxs = [ seriesCols.index(colName) for colName in columns ]
+
+        # columns computing storage directories, by their positions in the filled values
+        columnTags = dict( zip( seriesCols, self.settings.tagsToRecord ) )
+        pathCols = [ ( valueIdx, colName ) for valueIdx, colName in enumerate(columns) if columnTags[colName] in self.storagePathTags ]
+
+        # a stored DICOM of each series to fill - or its storage directory, for series stored before their instances were recorded
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "SELECT SeriesId, MIN(StoragePath) FROM %s GROUP BY SeriesId" % self.settings.dbTblInstances )
+            instancePaths = dict( (row[0], row[1]) for row in dbCur.fetchall() )
+
+            # the series the columns weren't filled for yet - whether or not their DICOMs have values for them
+            dbCur.execute( "SELECT DISTINCT SeriesId FROM %s WHERE ColumnName IN ( %s )" % ( tblBackfillSeries, ', '.join([ '?' for colName in columns ]) ), columns )
+            pendingIds = set( row[0] for row in dbCur.fetchall() )
+        seriesPaths = []
+        seriesRecords = {}
+        for record in self.iterSeries():
+            if not full and record.id not in pendingIds:
+                continue
+            seriesPath = instancePaths.get(record.id) or self.storagePath(record, directory=True)
+            if seriesPath is not None:
+                seriesPaths.append( seriesPath )
+                if pathCols:
+                    seriesRecords[ str(record.SeriesInstanceUID) ] = record
+
+        # fill the series' columns in batches, as their DICOMs are read
+        qUpdate = "UPDATE %s SET %s WHERE SeriesInstanceUID = ?" % ( self.settings.dbTblSeries, ', '.join([ '%s = ?' % colName for colName in columns ]) )
+        updateSearch = bool( set(columns) & set(self.settings.dbSearchColumns) )
+        updateStats = bool( set(columns) & set(self.statsColumns()) )
+        batchSize = self.settings.backfillBatchSize
+        rows = []
+        numFilled = 0
+        numMoved = 0
+        for dcmPath, dcm in self.iterRead( self.iterSeriesDicoms(seriesPaths), numWorkers, headerOnly=True ):
+            if dcm is not None:
+                header = self.normalizeHeader(dcm)
+                if header is not None:
+                    values = [ header.values[colIdx] for colIdx in colIdxs ]
+                    if pathCols and self.movesSeriesDir( seriesRecords[ str(dcm.SeriesInstanceUID) ], pathCols, values, os.path.dirname(dcmPath) ):
+                        numMoved += 1
+                    rows.append( tuple(values) + ( str(dcm.SeriesInstanceUID), ) )
+
+            if len(rows) >= batchSize:
+                self.fillSeries( qUpdate, rows, updateSearch, updateStats, columns )
+                numFilled += len(rows)
+                rows = []
+
+                # display progress
+                sys.stdout.write( " Backfilled %d of %d series\r" % ( numFilled, len(seriesPaths) ) )
+                sys.stdout.flush()
 
-            # create storage directory
-            os.makedirs(storeDir)
+        # fill the last batch
+        if rows:
+            self.fillSeries( qUpdate, rows, updateSearch, updateStats, columns )
+            numFilled += len(rows)
 
-        # check if file exists
-        if not os.path.isfile(storeDst):
-    
-            # copy file to new destination
-            try:
-                shutil.copyfile(dcmPath, storeDst)
-            except Exception, e:
-                print repr(e)
-                print "Failed to store DICOM: %s" % dcmPath
-                return None
+        sys.stdout.write( "                                        \r" )
+        sys.stdout.flush()
 
-            # increment NumberOfDicoms field in database
-            with self.dbCon:
-                dbCur = self.dbCon.cursor()
-                dbCur.execute( "UPDATE %s SET NumberOfDicoms = NumberOfDicoms + 1 WHERE SeriesInstanceUID = '%s'" % ( self.settings.dbTblSeries, dcm.SeriesInstanceUID ) )
+        # columns filled for all series, not counting series deleted since
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "DELETE FROM %s WHERE SeriesId NOT IN ( SELECT id FROM %s )" % ( tblBackfillSeries, self.settings.dbTblSeries ) )
+            dbCur.execute( "DELETE FROM %s WHERE ColumnName NOT IN ( SELECT ColumnName FROM %s )" % ( tblBackfills, tblBackfillSeries ) )
 
-        # return storage destination
-        return storeDst
+        if numFilled < len(seriesPaths):
+            print "%d series could not be backfilled." % ( len(seriesPaths) - numFilled )
+        if numMoved:
+            print "%d series kept their values of columns in storage paths, which would have moved their storage directory." % numMoved
+
+        return numFilled
 
 
 
     #--------------------------------------------------------------------------------------------
-    # convenience function to read, record, store, and delete DICOM files
-    def manage ( self, dcmPaths, deleteDcm=False, recordDcm=True, storeDcm=True ):
-    
-        # check if multiple DICOM paths are provided
-        if isinstance(dcmPaths, list):
+    # records the stored instances of series without any recorded (i.e. stored before the instances table), from the DICOMs
+    # in their storage directories, read header-only in parallel worker processes - returns the number of instances recorded
+    def backfillInstances ( self, numWorkers=None ):
+        tblInstances = self.settings.dbTblInstances
 
-            numPaths = len( dcmPaths )
-            progress = 0
-            for dcmIdx, dcmPath in enumerate( dcmPaths ):
+        # number of processes reading DICOMs
+        if numWorkers is None:
+            numWorkers = self.settings.backfillWorkers
+
+        # series with stored DICOMs, but no recorded instances
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "SELECT id FROM %s WHERE NumberOfDicoms > 0 AND id NOT IN ( SELECT SeriesId FROM %s )" % ( self.settings.dbTblSeries, tblInstances ) )
+            seriesIds = set( row[0] for row in dbCur.fetchall() )
+        if not seriesIds:
+            return 0
+
+        # the DICOMs in their storage directories
+        dcmPaths = []
+        numMissing = 0
+        for record in self.iterSeries():
+            if record.id not in seriesIds:
+                continue
+            seriesDir = self.storagePath(record, directory=True)
+            if seriesDir is None or not os.path.isdir(seriesDir):
+                numMissing += 1
+                continue
+            dcmPaths.extend( fullPath for name, fullPath, isFile, isDir in self.listDir(seriesDir) if isFile and name.endswith('.dcm') )
+
+        # record them in batches as they're read - only DICOMs at their storage path, i.e. of their directory's series
+        batchSize = self.settings.backfillBatchSize
+        instances = []
+        numRecorded = 0
+        for dcmPath, dcm in self.iterRead( dcmPaths, numWorkers, headerOnly=True ):
+            if dcm is not None:
+                storeDst = self.storagePath(dcm)
+                if storeDst is not None and os.path.normpath( os.path.abspath(storeDst) ) == os.path.normpath( os.path.abspath(dcmPath) ):
+                    instances.append( (dcm, dcmPath, None) )
+                else:
+                    print "DICOM not at its storage path. Unable to record instance: %s" % dcmPath
 
-                # recursive call to manage each DICOM
-                self.manage(dcmPath, deleteDcm, recordDcm, storeDcm)
+            if len(instances) >= batchSize:
+                with self.dbCon:
+                    self.recordInstances( self.dbCon.cursor(), instances )
+                numRecorded += len(instances)
+                instances = []
 
                 # display progress
-                progress = ((dcmIdx * 100) / numPaths)
-                sys.stdout.write( " Progress: %d%% \r" % progress )
+                sys.stdout.write( " Recorded %d of %d stored DICOMs\r" % ( numRecorded, len(dcmPaths) ) )
                 sys.stdout.flush()
 
-            # progress
-            sys.stdout.write( "                         \r" )
-            sys.stdout.flush()
+        # record the last batch
+        if instances:
+            with self.dbCon:
+                self.recordInstances( self.dbCon.cursor(), instances )
+            numRecorded += len(instances)
 
-        # check for single DICOM path
-        elif isinstance(dcmPaths, basestring):
-            dcmPath = dcmPaths
+        sys.stdout.write( "                                        \r" )
+        sys.stdout.flush()
 
-            # read DICOM
-            dcm = self.read(dcmPath)
-            if dcm == None:
-                print "Couldn't read. Unable to manage DICOM: %s" % dcmPath
-                return None
+        if numMissing:
+            print "%d series with stored DICOMs not recorded per instance have no storage directory." % numMissing
 
-            if recordDcm:
-                # record DICOM in DB
-                recordID = self.record(dcm)
-                if recordID == None:
-                    print "Couldn't record. Unable to manage DICOM: %s" % dcmPath
-                    return None
+        return numRecorded
 
-            if storeDcm:
-                # store DICOM in managed file tree
-                dstPath = self.store(dcm)
-                if dstPath == None:
-                    print "Couldn't store. Unable to manage DICOM: %s" % dcmPath
-                    return None
 
-            if deleteDcm:
-                # delete source DICOM
-                os.remove(dcmPath)
-        
 
-        
     #--------------------------------------------------------------------------------------------
-    # creates a pydicom object containing the database record of a DICOM series
-    def getSeriesRecord ( self, recordID=None, seriesUID=None, accessionNumber=None, patientID=None ):
-        whereClause = None
-        queryArg = None
+    # checks if backfilled values of columns in storage paths would move a series' storage directory away from where its DICOMs are -
+    # if so, keeps the series' recorded values of these columns in the values to fill
+    def movesSeriesDir ( self, record, pathCols, values, dcmDir ):
 
-        # set SQL where clause to search database
-        if recordID is not None:
-            whereClause = " WHERE id = ? "
-            queryArg = recordID
+        # the series' storage directory with the backfilled values - fine as the directory its DICOMs are in, or the one the series has now
+        filledValues = list( record.values )
+        for valueIdx, colName in pathCols:
+            filledValues[ record.fieldIndexes[colName] ] = values[valueIdx]
+        seriesDir = self.storageDir( SeriesRecord( record.fieldIndexes, filledValues ) )
+        if seriesDir == dcmDir or seriesDir == self.storageDir(record):
+            return False
 
-        elif seriesUID is not None:
-            whereClause = " WHERE SeriesInstanceUID = ? "
-            queryArg = seriesUID
+        for valueIdx, colName in pathCols:
+            values[valueIdx] = record[colName]
+        return True
 
-        elif accessionNumber is not None:
-            whereClause = " WHERE AccessionNumber = ? "
-            queryArg = accessionNumber
 
-        elif patientID is not None:
-            whereClause = " WHERE PatientID = ? "
-            queryArg = patientID
 
-        else:
-            return None
+    #--------------------------------------------------------------------------------------------
+    # yields a DICOM path for each of the given paths: the path of a stored DICOM, or the first DICOM in a series' storage directory
+    def iterSeriesDicoms ( self, seriesPaths ):
+        for seriesPath in seriesPaths:
+            if os.path.isdir(seriesPath):
+                fileNames = sorted([ fileName for fileName in os.listdir(seriesPath) if fileName.endswith('.dcm') ])
+                if not fileNames:
+                    print "No DICOMs found in series directory: %s" % seriesPath
+                    continue
+                seriesPath = os.path.join( seriesPath, fileNames[0] )
+            yield seriesPath
 
-        # get series record from database
-        qFind = "SELECT * FROM %s %s LIMIT 1" % (self.settings.dbTblSeries, whereClause)
-        series = None
+
+
+    #--------------------------------------------------------------------------------------------
+    # updates a batch of series with backfilled values, given as rows ending with their SeriesInstanceUID,
+    # and, option, their full-text search index entries and their summary statistics - marking the given columns filled for them
+    def fillSeries ( self, qUpdate, rows, updateSearch=False, updateStats=False, columns=() ):
+        seriesUIDs = [ row[-1] for row in rows ]
+
+        # storage directories are computed from the series' records again
+        for seriesUID in seriesUIDs:
+            self.seriesDirCache.pop( seriesUID, None )
         with self.dbCon:
             dbCur = self.dbCon.cursor()
-            dbCur.execute( qFind, (queryArg,) )
-            series = dbCur.fetchone()
 
-        # check record exists
-        if series is None:
-            print "Can't get series record with given arg: %s" % str(queryArg)
-            return None
+            # uncount the series' old values from the summary statistics - the series themselves aren't other series
+            if updateStats:
+                statsRows = self.selectStats(dbCur, 'SeriesInstanceUID', seriesUIDs)
+                seriesIds = frozenset( row['id'] for row in statsRows )
+                self.countStats( dbCur, statsRows, -1, seriesIds )
 
-        # create new DICOM object
-        dcm = FileDataset(None,{},None)
+            dbCur.executemany( qUpdate, rows )
 
-        # fill object from record
-        for dcmHeaderTag in self.settings.tagsToRecord:
-            tagName = DicomDictionary[dcmHeaderTag][4]
-            if series[tagName]:
-                setattr( dcm, tagName, series[tagName] )
+            # count the series' new values
+            if updateStats:
+                self.countStats( dbCur, self.selectStats(dbCur, 'SeriesInstanceUID', seriesUIDs), 1, seriesIds )
 
-        # add record ID
-        dcm.recordID = series['id']
+            if updateSearch:
+                self.updateSeriesSearch( dbCur, seriesUIDs )
 
-        return dcm
+            dbCur.executemany( "DELETE FROM %s WHERE ColumnName = ? AND SeriesId IN ( SELECT id FROM %s WHERE SeriesInstanceUID = ? )" % ( self.settings.dbTblBackfillSeries, self.settings.dbTblSeries ),
+                               [ (colName, seriesUID) for seriesUID in seriesUIDs for colName in columns ] )
 
 
 
     #--------------------------------------------------------------------------------------------
-    # conveniece function to compute the storage directory of a recorded DICOM series
-    def getSeriesDir ( self, recordID=None, seriesUID=None, accessionNumber=None, patientID=None ):
+    # caches the record IDs of the given series found in the database
+    def lookupSeriesIds ( self, dbCur, seriesUIDs ):
 
-        # get DICOM object representation of series record
-        dcm = self.getSeriesRecord(recordID, seriesUID, accessionNumber, patientID)
-        if dcm == None:
-            print "Can't generate series directory."
-            return
+        # query in chunks to stay under SQLite's limit of query parameters
+        chunkSize = 500
+        for chunkIdx in xrange(0, len(seriesUIDs), chunkSize):
+            chunk = seriesUIDs[chunkIdx:chunkIdx + chunkSize]
+            qCheck = "SELECT id, SeriesInstanceUID FROM %s WHERE SeriesInstanceUID IN ( %s )" % ( self.settings.dbTblSeries, ', '.join([ '?' for i in xrange(len(chunk)) ]) )
+            dbCur.execute( qCheck, chunk )
+            for row in dbCur.fetchall():
+                self.seriesIdCache[ str(row[1]) ] = row[0]
 
-        # compute storage directory path for this series
-        seriesDir = self.storagePath(dcm, directory=True)
 
-        return seriesDir
+
+    #--------------------------------------------------------------------------------------------
+    # looks up the record IDs of the given series again, forgetting the cached IDs (and storage directories) of series
+    # no longer in the database - so they're recorded again, rather than stored under records that are gone
+    def refreshSeriesIds ( self, dbCur, seriesUIDs ):
+        seriesUIDs = list( seriesUIDs )
+        for seriesUID in seriesUIDs:
+            self.seriesIdCache.pop( seriesUID, None )
+        self.lookupSeriesIds( dbCur, seriesUIDs )
+        for seriesUID in seriesUIDs:
+            if seriesUID not in self.seriesIdCache:
+                self.seriesDirCache.pop( seriesUID, None )
 
 
 
     #--------------------------------------------------------------------------------------------
-    # copies managed DICOM files to a given location with optional formatting
-    def export(self, recordIDs, dstRoot, ageBreakdown=False, directoryTree=True, readableSeriesSlug=True):
+    # computes a patient's age in days at scan time from the study and birth dates (YYYYMMDD),
+    # or else from the patient's age (nnnD, nnnW, nnnM, or nnnY - months and years approximated as 30 and 365 days)
+    def ageInDays ( self, studyDate, birthDate, patientAge ):
 
-        # check if multiple series record IDs were provided
-        if isinstance(recordIDs, list):
-            numRecords = len( recordIDs )
-            progress = 0
+        # from dates
+        try:
+            studyDate = datetime.datetime.strptime( str(studyDate).strip()[:8], '%Y%m%d' )
+            birthDate = datetime.datetime.strptime( str(birthDate).strip()[:8], '%Y%m%d' )
+            return (studyDate - birthDate).days
+        except (ValueError, UnicodeError):
+            pass
 
-            # loop through series IDs
-            for idx, recordID in enumerate( recordIDs ):
+        # from age
+        try:
+            patientAge = str(patientAge or '').strip().upper()
+            unitDays = { 'D': 1, 'W': 7, 'M': 30, 'Y': 365 }.get( patientAge[-1:] )
+            if unitDays is not None and patientAge[:-1].isdigit():
+                return int( patientAge[:-1] ) * unitDays
+        except UnicodeError:
+            pass
 
-                # recursive call to manage each DICOM
-                self.export(recordID, dstRoot, ageBreakdown, directoryTree, readableSeriesSlug)
+        return None
 
-                # display progress
-                progress = ((idx * 100) / numRecords)
-                sys.stdout.write( " Progress: %d%% \r" % progress )
-                sys.stdout.flush()
 
-            # progress
-            sys.stdout.write( "                         \r" )
-            sys.stdout.flush()
 
-        # check for single series record ID
-        elif isinstance(recordIDs, int):
-            recordID = recordIDs
+    #--------------------------------------------------------------------------------------------
+    # finds the age range of the settings' age breakdown containing an age in days, by binary search - returns None if none does
+    def ageBucket ( self, ageInDays ):
+        if ageInDays is None:
+            return None
 
-            # make functions local variables for speed
-            os_path_exists = os.path.exists
-            os_path_join = os.path.join
-            
-            # find series record in SQLite database
-            dcm = self.getSeriesRecord(recordID)
-            if dcm is None:
-                # series not found in database
-                print "Series record with id %d not found!" % recordID
-                return
-                        
-            # determine source-series directory
-            srcSeriesDir = self.storagePath(dcm, directory=True)
-            
-            # check that source-series directory exists
-            if not os_path_exists( srcSeriesDir ):
-                print "Source series directory not found: %s" % srcSeriesDir
-                return
-            
-            # check that destination-root directory exists
-            if not os_path_exists( dstRoot ):
-                print "Destination root directory not found: %s" % dstRoot
-                return
+        # sort the ranges' lower bounds once per manager
+        if getattr(self, 'ageBreakdownBounds', None) is None:
+            self.ageBreakdownRanges = sorted( self.settings.ageBreakdown, key=lambda ageRange: ageRange['minDay'] )
+            self.ageBreakdownBounds = [ ageRange['minDay'] for ageRange in self.ageBreakdownRanges ]
 
-            # option: do/don't breakdown exported DICOMs by age
-            if ageBreakdown:
+        # the last range starting at or below the age, if it ends at or above it
+        rangeIdx = bisect.bisect_right( self.ageBreakdownBounds, ageInDays ) - 1
+        if rangeIdx < 0 or ageInDays > self.ageBreakdownRanges[rangeIdx]['maxDay']:
+            return None
+        return self.ageBreakdownRanges[rangeIdx]
 
-                # determine patient age in days at scan time
-                ageInDays = None
-                with self.dbCon:
-                    dbCur = self.dbCon.cursor()
-                    qAge = "SELECT julianday(substr(StudyDate, 1,4) || '-' || substr(StudyDate,5,2)  || '-' || substr(StudyDate, 7,2)) - julianday(substr(PatientBirthDate, 1,4) || '-' || substr(PatientBirthDate,5,2)  || '-' || substr(PatientBirthDate, 7,2)) FROM %s WHERE id = ? LIMIT 1" % self.settings.dbTblSeries
-                    dbCur.execute( qAge, (recordID,) )
-                    ageInDays = dbCur.fetchone()[0]
-            
-                # modify destination root directory accordingly
-                for ageRange in self.settings.ageBreakdown:
-                    # determine age range
-                    if ageInDays >= ageRange['minDay'] and ageInDays <= ageRange['maxDay']:
-                        dstRoot = os_path_join(dstRoot, ageRange['name'])
 
-            # option: do/don't replicate storage file-tree for exported DICOMs
-            if directoryTree:
-                # create destination path
-                dstSeriesDir = srcSeriesDir.replace( self.settings.dicomDir, dstRoot )
 
-            else:
-                # create destination path
-                seriesSlug = os.path.basename(srcSeriesDir)
-                dstSeriesDir = os_path_join( dstRoot, seriesSlug )
+    #--------------------------------------------------------------------------------------------
+    # gets the series table's columns summarized in the statistics table
+    def statsColumns ( self ):
+        seriesCols = self.seriesColumns()
+        return [ colName for colName in self.settings.statsColumns if colName in seriesCols ]
 
-            # option: do/don't keep human readable series slug
-            if not readableSeriesSlug:
 
-                # alter destination path
-                dstSeriesDir = os_path_join( os.path.dirname(dstSeriesDir), dcm.SeriesInstanceUID )
 
-            # check that series destination doesn't exist yet
-            if os_path_exists( dstSeriesDir ):
-                print "Destination series directory already exists, skipping: %s" % dstSeriesDir
-                return
-        
-            # copy source to destination
-            shutil.copytree( srcSeriesDir, dstSeriesDir )
+    #--------------------------------------------------------------------------------------------
+    # gets series' rows for the summary statistics by the values of a column, in chunks: id, SeriesInstanceUID, StudyInstanceUID,
+    # PatientID, NumberOfDicoms, and the summarized columns' values as text (no value as empty text), like rebuildStats
+    def selectStats ( self, dbCur, colName, values ):
+        statsCols = [ "COALESCE(CAST(%s AS TEXT), '')" % statsCol for statsCol in self.statsColumns() ]
+        rows = []
+        chunkSize = 500
+        for chunkIdx in xrange(0, len(values), chunkSize):
+            chunk = values[chunkIdx:chunkIdx + chunkSize]
+            dbCur.execute( "SELECT %s FROM %s WHERE %s IN ( %s )" % ( ', '.join( ['id', 'SeriesInstanceUID', 'StudyInstanceUID', 'PatientID', 'NumberOfDicoms'] + statsCols ),
+                                                                       self.settings.dbTblSeries, colName, ', '.join([ '?' for i in xrange(len(chunk)) ]) ), chunk )
+            rows.extend( dbCur.fetchall() )
+        return rows
 
 
 
     #--------------------------------------------------------------------------------------------
-    # deletes managed DICOM files
-    def delete(self, recordIDs):
+    # gets the ( dimension, value ) statistics keys of series' rows from selectStats - the whole archive is the dimension ''
+    def statsKeys ( self, row ):
+        return [ ('', u'') ] + [ (colName, row[colIdx + 5]) for colIdx, colName in enumerate( self.statsColumns() ) ]
 
-        # check if multiple series record IDs were provided
-        if isinstance(recordIDs, list):
-            numRecords = len( recordIDs )
-            progress = 0
 
-            # loop through series IDs
-            for idx, recordID in enumerate( recordIDs ):
 
-                # recursive call to manage each DICOM
-                self.delete(recordID)
+    #--------------------------------------------------------------------------------------------
+    # counts series, given as rows from selectStats, in the summary statistics table -
+    # after recording them (sign 1, ignoring the new series' IDs when checking for other series) or after deleting them (sign -1)
+    # studies and patients count once per ( dimension, value ), so the table's other series of the same study or patient are checked
+    def countStats ( self, dbCur, rows, sign, newIds=frozenset() ):
+
+        # sum up the changes of each ( dimension, value )
+        deltas = {}
+        groupKeys = { 'StudyInstanceUID': {}, 'PatientID': {} }
+        for row in rows:
+            keys = self.statsKeys(row)
+            for key in keys:
+                delta = deltas.setdefault( key, [0, 0, 0, 0] )
+                delta[0] += sign
+                delta[1] += sign * row['NumberOfDicoms']
+
+            # count the series' study and patient where the table has no other series of theirs with the same value
+            for deltaIdx, groupCol in ( (2, 'StudyInstanceUID'), (3, 'PatientID') ):
+                groupValue = row[groupCol]
+                if groupValue is None:
+                    continue
+                keysPresent = groupKeys[groupCol].get(groupValue)
+                if keysPresent is None:
+                    keysPresent = groupKeys[groupCol][groupValue] = set()
+                    for otherRow in self.selectStats(dbCur, groupCol, [groupValue]):
+                        if otherRow['id'] not in newIds:
+                            keysPresent.update( self.statsKeys(otherRow) )
+                for key in keys:
+                    if key not in keysPresent:
+                        keysPresent.add(key)
+                        deltas[key][deltaIdx] += sign
+
+        # update statistics
+        self.applyStats(dbCur, deltas)
 
-                # display progress
-                progress = ((idx * 100) / numRecords)
-                sys.stdout.write( " Progress: %d%% \r" % progress )
-                sys.stdout.flush()
 
-            # progress
-            sys.stdout.write( "                         \r" )
-            sys.stdout.flush()
 
-        # check for single series record ID
-        elif isinstance(recordIDs, int):
-            recordID = recordIDs
+    #--------------------------------------------------------------------------------------------
+    # counts stored DICOMs, given per SeriesInstanceUID, in the summary statistics table
+    def countStatsDicoms ( self, dbCur, numStored ):
+        deltas = {}
+        for row in self.selectStats(dbCur, 'SeriesInstanceUID', numStored.keys()):
+            numDicoms = numStored.get( str(row['SeriesInstanceUID']), 0 )
+            for key in self.statsKeys(row):
+                deltas.setdefault( key, [0, 0, 0, 0] )[1] += numDicoms
 
-            # find storage directory
-            seriesDir = self.getSeriesDir(recordID=recordID)
-            if seriesDir == None:
-                # series storage directory not found
-                print "Can't delete series with id %d." % recordID
+        # update statistics
+        self.applyStats(dbCur, deltas)
 
-            else:
-                # check that storage directory exists
-                if not os.path.exists( seriesDir ):
-                    print "Can't delete DICOMs. Series directory not found: %s" % seriesDir
 
-                else:
-                    # delete series directory
-                    shutil.rmtree( seriesDir )                    
 
-            # delete series record from database
-            with self.dbCon:
-                dbCur = self.dbCon.cursor()
-                #dbCur.execute( "DELETE FROM %s WHERE SeriesInstanceUID=?" % self.settings.dbTblSeriesNotes, (recordID,) )
-                dbCur.execute( "DELETE FROM %s WHERE id=?" % self.settings.dbTblSeries, (recordID,) )
+    #--------------------------------------------------------------------------------------------
+    # adds changes, given per ( dimension, value ), to the summary statistics table
+    def applyStats ( self, dbCur, deltas ):
+        if not deltas:
+            return
+        tblStats = self.settings.dbTblStats
+        dbCur.executemany( "INSERT OR IGNORE INTO %s ( Dimension, Value ) VALUES ( ?, ? )" % tblStats, deltas.keys() )
+        dbCur.executemany( ("UPDATE %s SET NumberOfSeries = NumberOfSeries + ?, NumberOfDicoms = NumberOfDicoms + ?, "
+                            "NumberOfStudies = NumberOfStudies + ?, NumberOfPatients = NumberOfPatients + ? WHERE Dimension = ? AND Value = ?") % tblStats,
+                           [ tuple(delta) + key for key, delta in deltas.iteritems() ] )
+        dbCur.execute( "DELETE FROM %s WHERE NumberOfSeries <= 0" % tblStats )
+
 
 
-    
     #--------------------------------------------------------------------------------------------
-    # records notes about DICOM series
-    def note(self, seriesInstanceUIDs, note):
-            
-        # check for series IDs list
-        if not isinstance( seriesInstanceUIDs, list ):
-            print "Error! Must provide a list of series IDs"
-            return
-        
-        # check that series IDs list is not empty
-        numIds = len( seriesInstanceUIDs )
-        if numIds == 0:
-            print "No series IDs provided!"
-            return
-        
-        # loop through list of series ids
-        for seriesInstanceUID in seriesInstanceUIDs:
-        
-            # check that series is owned by this project
+    # recomputes the summary statistics table from the series table, e.g. after changing the summarized columns
+    def rebuildStats ( self, dbCur=None ):
+
+        # own transaction, unless given a cursor
+        if dbCur is None:
             with self.dbCon:
-                dbCur = self.dbCon.cursor()
+                self.rebuildStats( self.dbCon.cursor() )
+            return
+
+        tblStats = self.settings.dbTblStats
+        tblSeries = self.settings.dbTblSeries
+        counts = "COUNT(*), COALESCE(SUM(NumberOfDicoms), 0), COUNT(DISTINCT StudyInstanceUID), COUNT(DISTINCT PatientID)"
+        dbCur.execute( "DELETE FROM %s" % tblStats )
+        dbCur.execute( "INSERT INTO %s SELECT '', '', %s FROM %s HAVING COUNT(*) > 0" % ( tblStats, counts, tblSeries ) )
+        for colName in self.statsColumns():
+            dbCur.execute( "INSERT INTO %s SELECT '%s', COALESCE(CAST(%s AS TEXT), ''), %s FROM %s GROUP BY 2" % ( tblStats, colName, colName, counts, tblSeries ) )
+
 
-                # record note
-                dbCur.execute( "INSERT INTO %s ( SeriesInstanceUID, Note ) VALUES ( ?, ? )" % self.settings.dbTblSeriesNotes, (seriesInstanceUID, note) )
 
-            
-            
     #--------------------------------------------------------------------------------------------
-    # deletes DICOM series notes
-    def deleteNotes(self, noteIds):
-            
-        # check for series IDs list
-        if not isinstance( noteIds, list ):
-            print "Error! Must provide a list of series IDs"
-            return
-        
+    # copies a DICOM file into a human-readable filetree (or moves it, if requested)
+    def store ( self, dcm, moveDcm=False ):
+        return self.storeMany( [dcm], moveDcm )[0]
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # copies many DICOM files into the human-readable filetree (or moves them, if requested), updating series' counts in one transaction
+    def storeMany ( self, dcms, moveDcm=False ):
+        storeMethods = self.settings.storeMethods
+        blobStorage = self.settings.blobStorage
+        dstPaths = []
+        numStored = {}
+        instances = []
+
+        for dcm in dcms:
+            dcmPath = dcm.path
+            dstPaths.append( None )
+
+            # check that the dicom exists
+            if not os.path.isfile(dcmPath):
+                print "Dicom not found: %s" % dcmPath
+                continue
+
+            # determine where to store the DICOM
+            storeDst = self.storagePath(dcm)
+            if storeDst == None:
+                print "Couldn't store DICOM: %s" % dcmPath
+                continue
+            storeDir = os.path.dirname(storeDst)
+
+            # check if directory exists
+            if not os.path.isdir(storeDir):
+
+                # create storage directory
+                os.makedirs(storeDir)
+
+            # check if file exists
+            blobHash = None
+            if not os.path.isfile(storeDst):
+
+                # copy file to new destination - or rename, link, or clone it, as set in the settings
+                try:
+                    if blobStorage:
+                        # store file content once, linking it into the filetree
+                        blobHash, blobPath = self.storeBlob(dcmPath, moveDcm)
+                        dicomfiles.transferFile(blobPath, storeDst, [ 'hardlink', 'reflink', 'copy' ])
+                    else:
+                        dicomfiles.transferFile(dcmPath, storeDst, storeMethods, moveDcm)
+                except Exception, e:
+                    print repr(e)
+                    print "Failed to store DICOM: %s" % dcmPath
+                    continue
+
+                # count DICOMs stored per series
+                seriesUID = str( dcm.SeriesInstanceUID )
+                numStored[seriesUID] = numStored.get(seriesUID, 0) + 1
+
+            # storage destination
+            dstPaths[-1] = storeDst
+            instances.append( (dcm, storeDst, blobHash) )
+
+        # record stored instances and increment NumberOfDicoms field in database, once per series
+        if instances:
+            with self.dbCon:
+                dbCur = self.dbCon.cursor()
+                self.recordInstances(dbCur, instances)
+                dbCur.executemany( "UPDATE %s SET NumberOfDicoms = NumberOfDicoms + ? WHERE SeriesInstanceUID = ?" % self.settings.dbTblSeries, [ (num, seriesUID) for seriesUID, num in numStored.iteritems() ] )
+                self.countStatsDicoms(dbCur, numStored)
+
+        # return storage destinations
+        return dstPaths
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # stores a file's content in the content-addressed blob storage, if not there yet, returning its hash and blob path
+    def storeBlob ( self, srcPath, move=False ):
+
+        # hash content
+        blobHash = dicomfiles.hashFile(srcPath)
+        blobPath = self.blobPath(blobHash)
+
+        # check if content is already stored
+        if not os.path.isfile(blobPath):
+            blobDir = os.path.dirname(blobPath)
+            if not os.path.isdir(blobDir):
+                os.makedirs(blobDir)
+
+            # store under a temporary name first, so a blob is never partially written
+            tmpPath = blobPath + '.tmp'
+            dicomfiles.transferFile(srcPath, tmpPath, self.settings.storeMethods, move)
+            os.rename(tmpPath, blobPath)
+
+        return blobHash, blobPath
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # computes the path of a blob in the content-addressed blob storage
+    def blobPath ( self, blobHash ):
+        return os.path.join( self.settings.blobDir, blobHash[:2], blobHash[2:4], blobHash )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # updates blobs' reference counts from the instances referencing them, returning the hashes of unreferenced blobs
+    def countBlobRefs ( self, dbCur, blobHashes ):
+        tblBlobs = self.settings.dbTblBlobs
+        unreferenced = []
+
+        # query in chunks to stay under SQLite's limit of query parameters
+        blobHashes = list(blobHashes)
+        chunkSize = 500
+        for chunkIdx in xrange(0, len(blobHashes), chunkSize):
+            chunk = blobHashes[chunkIdx:chunkIdx + chunkSize]
+            params = ', '.join([ '?' for i in xrange(len(chunk)) ])
+            dbCur.execute( "UPDATE %s SET RefCount = ( SELECT COUNT(*) FROM %s WHERE BlobHash = %s.Hash ) WHERE Hash IN ( %s )" % ( tblBlobs, self.settings.dbTblInstances, tblBlobs, params ), chunk )
+            dbCur.execute( "SELECT Hash FROM %s WHERE RefCount = 0 AND Hash IN ( %s )" % ( tblBlobs, params ), chunk )
+            unreferenced.extend( row[0] for row in dbCur.fetchall() )
+            dbCur.execute( "DELETE FROM %s WHERE RefCount = 0 AND Hash IN ( %s )" % ( tblBlobs, params ), chunk )
+
+        return unreferenced
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # deletes blobs from the content-addressed blob storage
+    def deleteBlobs ( self, blobHashes ):
+        for blobHash in blobHashes:
+            blobPath = self.blobPath(blobHash)
+            if os.path.isfile(blobPath):
+                os.remove(blobPath)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # records stored DICOM instances, given as ( pydicom object, storage path, blob hash ) tuples, in the instances table
+    def recordInstances ( self, dbCur, instances ):
+
+        # find record IDs of series not recorded by this manager
+        seriesIdCache = self.seriesIdCache
+        seriesUIDs = set( str(instance[0].SeriesInstanceUID) for instance in instances )
+        self.lookupSeriesIds( dbCur, [ seriesUID for seriesUID in seriesUIDs if seriesIdCache.get(seriesUID) is None ] )
+
+        # collect instance data
+        rows = []
+        blobs = {}
+        for dcm, storeDst, blobHash in instances:
+            seriesID = seriesIdCache.get( str(dcm.SeriesInstanceUID) )
+            if seriesID is None:
+                continue
+
+            try:
+                instanceNumber = int( dcm.InstanceNumber )
+            except Exception:
+                instanceNumber = None
+
+            # (str of a pydicom UID is its name, e.g. 'Explicit VR Little Endian', rather than the UID itself)
+            fileMeta = getattr(dcm, 'file_meta', None)
+            transferSyntax = str.__str__( fileMeta.TransferSyntaxUID ) if fileMeta is not None and 'TransferSyntaxUID' in fileMeta else None
+
+            fileSize = os.path.getsize(storeDst)
+            rows.append( ( str(dcm.SOPInstanceUID), seriesID, instanceNumber, storeDst, fileSize, transferSyntax, blobHash ) )
+            if blobHash is not None:
+                blobs[blobHash] = fileSize
+
+        # record instances not recorded yet
+        qInsert = "INSERT OR IGNORE INTO %s ( SOPInstanceUID, SeriesId, InstanceNumber, StoragePath, FileSize, TransferSyntaxUID, BlobHash ) VALUES ( ?, ?, ?, ?, ?, ?, ? )" % self.settings.dbTblInstances
+        dbCur.executemany( qInsert, rows )
+
+        # record blobs and their reference counts
+        if blobs:
+            dbCur.executemany( "INSERT OR IGNORE INTO %s ( Hash, FileSize ) VALUES ( ?, ? )" % self.settings.dbTblBlobs, blobs.iteritems() )
+            self.deleteBlobs( self.countBlobRefs(dbCur, blobs) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # convenience function to read, record, store, and delete DICOM files
+    def manage ( self, dcmPaths, deleteDcm=False, recordDcm=True, storeDcm=True, numWorkers=None, skipUnchanged=None ):
+
+        # check for single DICOM path
+        if isinstance(dcmPaths, basestring):
+            dcmPath = dcmPaths
+
+            # read DICOM
+            dcm = self.read(dcmPath)
+
+            self.manageBatch( [(dcmPath, dcm)], deleteDcm, recordDcm, storeDcm )
+
+        # otherwise, multiple DICOM paths are provided - a list, or any iterable such as iterFind's
+        else:
+
+            # number of processes reading DICOMs
+            if numWorkers is None:
+                numWorkers = self.settings.manageWorkers
+
+            numPaths = len( dcmPaths ) if hasattr(dcmPaths, '__len__') else None
+
+            # option - skip files unchanged since they were last recorded and stored
+            if skipUnchanged is None:
+                skipUnchanged = self.settings.manageSkipUnchanged
+            if skipUnchanged and recordDcm and storeDcm:
+                dcmPaths = self.iterChanged(dcmPaths)
+            batchSize = self.settings.manageBatchSize
+            batch = []
+            progress = 0
+            for dcmIdx, (dcmPath, dcm) in enumerate( self.iterRead(dcmPaths, numWorkers) ):
+
+                # manage DICOMs in batches - reading may happen in worker processes, but only this one writes
+                batch.append( (dcmPath, dcm) )
+                if len(batch) >= batchSize:
+                    self.manageBatch(batch, deleteDcm, recordDcm, storeDcm)
+                    batch = []
+
+                    # display progress
+                    if numPaths:
+                        progress = ((dcmIdx * 100) / numPaths)
+                        sys.stdout.write( " Progress: %d%% \r" % progress )
+                    else:
+                        sys.stdout.write( " Progress: %d DICOMs \r" % (dcmIdx + 1) )
+                    sys.stdout.flush()
+
+            # manage the last batch
+            if batch:
+                self.manageBatch(batch, deleteDcm, recordDcm, storeDcm)
+
+            # progress
+            sys.stdout.write( "                         \r" )
+            sys.stdout.flush()
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # lazily filters out DICOM paths whose size, modification time, and inode haven't changed since they were last managed
+    def iterChanged ( self, dcmPaths ):
+
+        # use a connection of its own, since this may run in manage's feeder thread
+        dbCon = sqlite3.connect(self.settings.dbPath)
+        try:
+            batch = []
+            for dcmPath in dcmPaths:
+                batch.append(dcmPath)
+                if len(batch) >= 500:
+                    for changedPath in self.filterChanged(dbCon, batch):
+                        yield changedPath
+                    batch = []
+
+            for changedPath in self.filterChanged(dbCon, batch):
+                yield changedPath
+
+        finally:
+            dbCon.close()
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the DICOM paths whose size, modification time, and inode differ from the ingest ledger's
+    def filterChanged ( self, dbCon, dcmPaths ):
+
+        # get ledger entries of these paths
+        sourcePaths = [ os.path.abspath(dcmPath) for dcmPath in dcmPaths ]
+        qLedger = "SELECT SourcePath, FileSize, ModifiedTime, Inode FROM %s WHERE SourcePath IN ( %s )" % ( self.settings.dbTblIngestLedger, ', '.join([ '?' for i in xrange(len(sourcePaths)) ]) )
+        ledger = dict( (row[0], tuple(row[1:])) for row in dbCon.execute( qLedger, sourcePaths ) ) if sourcePaths else {}
+
+        # compare with the files' current state
+        changedPaths = []
+        for dcmPath, sourcePath in zip(dcmPaths, sourcePaths):
+            entry = ledger.get(sourcePath)
+            if entry is not None:
+                try:
+                    dcmStat = os.stat(dcmPath)
+                    if entry == ( dcmStat.st_size, dcmStat.st_mtime, dcmStat.st_ino ):
+                        continue
+                except OSError:
+                    pass
+            changedPaths.append(dcmPath)
+
+        return changedPaths
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # records managed DICOMs' source files in the ingest ledger
+    def recordIngested ( self, dcms ):
+
+        # collect source files' current state
+        rows = []
+        for dcm in dcms:
+            try:
+                dcmStat = os.stat(dcm.path)
+            except OSError:
+                continue
+            rows.append( ( os.path.abspath(dcm.path), dcmStat.st_size, dcmStat.st_mtime, dcmStat.st_ino, str(dcm.SeriesInstanceUID) ) )
+
+        # record in database
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.executemany( "INSERT OR REPLACE INTO %s ( SourcePath, FileSize, ModifiedTime, Inode, SeriesInstanceUID ) VALUES ( ?, ?, ?, ?, ? )" % self.settings.dbTblIngestLedger, rows )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # records, stores, and deletes a batch of already read DICOM files given as ( path, pydicom object ) pairs
+    def manageBatch ( self, batch, deleteDcm=False, recordDcm=True, storeDcm=True ):
+
+        # check DICOMs were read
+        dcms = []
+        for dcmPath, dcm in batch:
+            if dcm == None:
+                print "Couldn't read. Unable to manage DICOM: %s" % dcmPath
+            else:
+                dcms.append(dcm)
+
+        if recordDcm and dcms:
+            # record DICOMs in DB
+            recordIDs = self.recordMany(dcms)
+            for dcm, recordID in zip(dcms, recordIDs):
+                if recordID == None:
+                    print "Couldn't record. Unable to manage DICOM: %s" % dcm.path
+            dcms = [ dcm for dcm, recordID in zip(dcms, recordIDs) if recordID != None ]
+
+        if storeDcm and dcms:
+            # store DICOMs in managed file tree
+            dstPaths = self.storeMany(dcms, moveDcm=deleteDcm)
+            for dcm, dstPath in zip(dcms, dstPaths):
+                if dstPath == None:
+                    print "Couldn't store. Unable to manage DICOM: %s" % dcm.path
+            dcms = [ dcm for dcm, dstPath in zip(dcms, dstPaths) if dstPath != None ]
+
+        if recordDcm and storeDcm and not deleteDcm and dcms:
+            # remember source files, to skip them when managed again unchanged
+            self.recordIngested(dcms)
+
+        if deleteDcm:
+            # delete source DICOMs, unless moved when stored
+            for dcm in dcms:
+                if os.path.isfile(dcm.path):
+                    os.remove(dcm.path)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # creates a pydicom object containing the database record of a DICOM series
+    def getSeriesRecord ( self, recordID=None, seriesUID=None, accessionNumber=None, patientID=None ):
+
+        # get first matching series record from database
+        series = self.findSeriesRecord(recordID, seriesUID, accessionNumber, patientID)
+        if series is None:
+            return None
+
+        return self.recordToDataset(series)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the first series record matching the first of the given args, as a SeriesRecord
+    def findSeriesRecord ( self, recordID=None, seriesUID=None, accessionNumber=None, patientID=None ):
+
+        # set filter to search database
+        if recordID is not None:
+            filters = { 'id': recordID }
+
+        elif seriesUID is not None:
+            filters = { 'SeriesInstanceUID': seriesUID }
+
+        elif accessionNumber is not None:
+            filters = { 'AccessionNumber': accessionNumber }
+
+        elif patientID is not None:
+            filters = { 'PatientID': patientID }
+
+        else:
+            return None
+
+        # get series record from database
+        series = next( self.iterSeries(limit=1, **filters), None )
+
+        # check record exists
+        if series is None:
+            print "Can't get series record with given arg: %s" % str(filters.values()[0])
+            return None
+
+        return series
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # streams the records of all series matching the given column filters, as SeriesRecord objects
+    # (e.g. PatientID='7654321', Modality=['MR', 'CT'], SeriesDescription=None - a value, a list of values, or None for no value)
+    # and optionally in a range of patient age in days at scan time, and in ranges of other columns given as ( min, max ), inclusive
+    # (e.g. ranges={ 'RepetitionTime': (1800, 2500) } - min or max can be None)
+    def iterSeries ( self, orderBy='id', limit=None, minAgeInDays=None, maxAgeInDays=None, ranges={}, **filters ):
+
+        # check filter and order columns
+        columns = set( self.seriesColumns() + ['id', 'NumberOfDicoms', 'AgeInDays'] )
+        for colName in filters.keys() + ranges.keys() + [orderBy]:
+            if colName not in columns:
+                print "Can't query series. Unknown column: %s" % colName
+                return
+
+        # build where clause
+        conditions = []
+        params = []
+        for colName, value in sorted( filters.items() ):
+            if value is None:
+                conditions.append( "%s IS NULL" % colName )
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                value = list(value)
+                if not value:
+                    return
+                conditions.append( "%s IN ( %s )" % ( colName, ', '.join([ '?' for i in xrange(len(value)) ]) ) )
+                params.extend( value )
+            else:
+                conditions.append( "%s = ?" % colName )
+                params.append( value )
+        ranges = dict( ranges )
+        if minAgeInDays is not None or maxAgeInDays is not None:
+            ranges['AgeInDays'] = ( minAgeInDays, maxAgeInDays )
+        for colName, ( minValue, maxValue ) in sorted( ranges.items() ):
+            if minValue is not None:
+                conditions.append( "%s >= ?" % colName )
+                params.append( minValue )
+            if maxValue is not None:
+                conditions.append( "%s <= ?" % colName )
+                params.append( maxValue )
+
+        qFind = "SELECT * FROM %s" % self.settings.dbTblSeries
+        if conditions:
+            qFind += " WHERE " + " AND ".join(conditions)
+        qFind += " ORDER BY %s" % orderBy
+        if limit is not None:
+            qFind += " LIMIT %d" % limit
+
+        # stream rows as plain tuples, on a cursor of their own
+        dbCur = self.dbCon.cursor()
+        dbCur.row_factory = None
+        dbCur.execute( qFind, params )
+        fieldIndexes = self.seriesRecordFields( dbCur.description )
+        for values in dbCur:
+            yield SeriesRecord( fieldIndexes, values )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # maps the columns of a query on the series table to their indexes, by name and by DICOM tag, for SeriesRecord objects
+    def seriesRecordFields ( self, description ):
+        fieldIndexes = {}
+        for fieldIdx, column in enumerate( description ):
+            fieldIndexes[ column[0] ] = fieldIdx
+        for dcmHeaderTag, tagName in zip( self.settings.tagsToRecord, self.seriesColumns() ):
+            if tagName in fieldIndexes:
+                fieldIndexes[ dcmHeaderTag ] = fieldIndexes[tagName]
+        return fieldIndexes
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # creates a pydicom object from a series' record (a SeriesRecord or database row), for code that needs a Dataset
+    def recordToDataset ( self, series ):
+
+        # create new DICOM object
+        dcm = FileDataset(None,{},None)
+
+        # fill object from record
+        for tagName in self.seriesColumns():
+            if series[tagName]:
+                setattr( dcm, tagName, series[tagName] )
+
+        # add record ID, and no source path
+        dcm.recordID = series['id']
+        dcm.path = None
+
+        return dcm
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the recorded instances of a DICOM series, ordered by instance number
+    def getSeriesInstances ( self, recordID ):
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "SELECT * FROM %s WHERE SeriesId = ? ORDER BY InstanceNumber, id" % self.settings.dbTblInstances, (recordID,) )
+            return dbCur.fetchall()
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets the number of recorded instances of a DICOM series and their total size in bytes
+    def getSeriesSize ( self, recordID ):
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "SELECT COUNT(*), COALESCE(SUM(FileSize), 0) FROM %s WHERE SeriesId = ?" % self.settings.dbTblInstances, (recordID,) )
+            return tuple( dbCur.fetchone() )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # conveniece function to compute the storage directory of a recorded DICOM series
+    def getSeriesDir ( self, recordID=None, seriesUID=None, accessionNumber=None, patientID=None ):
+
+        # get series record
+        series = self.findSeriesRecord(recordID, seriesUID, accessionNumber, patientID)
+        if series is None:
+            print "Can't generate series directory."
+            return
+
+        # compute storage directory path for this series
+        seriesDir = self.storagePath(series, directory=True)
+
+        return seriesDir
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # copies managed DICOM files to a given location with optional formatting
+    # or, given an archive format, streams them into an archive at the given path or file object - see exportArchive
+    # returns a result per series (or the result, for a single series ID) - see exportMany
+    def export(self, recordIDs, dstRoot, ageBreakdown=False, directoryTree=True, readableSeriesSlug=True, numThreads=None, archiveFormat=None):
+
+        # check if multiple series record IDs were provided
+        if isinstance(recordIDs, list):
+            if archiveFormat is not None:
+                return self.exportArchive(recordIDs, dstRoot, archiveFormat, ageBreakdown, directoryTree, readableSeriesSlug)
+            return self.exportMany(recordIDs, dstRoot, ageBreakdown, directoryTree, readableSeriesSlug, numThreads)
+
+        # check for single series record ID
+        elif isinstance(recordIDs, int):
+            return self.export([recordIDs], dstRoot, ageBreakdown, directoryTree, readableSeriesSlug, numThreads, archiveFormat)[0]
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # copies many managed DICOM series to a given location, concurrently
+    # returns a dict per series, in the given order: recordID, source and destination directories,
+    # status ('exported', 'skipped', or 'error'), and message
+    def exportMany(self, recordIDs, dstRoot, ageBreakdown=False, directoryTree=True, readableSeriesSlug=True, numThreads=None):
+
+        # number of threads copying series
+        if numThreads is None:
+            numThreads = self.settings.exportThreads
+
+        # plan each series' export
+        results = [ { 'recordID': recordID, 'source': None, 'destination': None, 'status': 'error', 'message': None } for recordID in recordIDs ]
+
+        # check that destination-root directory exists
+        if not os.path.exists( dstRoot ):
+            for result in results:
+                result['message'] = "Destination root directory not found: %s" % dstRoot
+            return results
+
+        # find series records in SQLite database, all at once
+        seriesRecords = self.getSeriesRecords(recordIDs)
+
+        # compute source and destination directories up front
+        for result in results:
+            recordID = result['recordID']
+            series = seriesRecords.get(recordID)
+            if series is None:
+                # series not found in database
+                result['message'] = "Series record with id %s not found!" % recordID
+                continue
+
+            ageInDays = series['AgeInDays'] if ageBreakdown else None
+            result['source'], result['destination'] = self.exportPaths(series, dstRoot, ageInDays, ageBreakdown, directoryTree, readableSeriesSlug)
+            if result['source'] is None:
+                result['message'] = "Can't generate series directory of series with id %s." % recordID
+
+        # copy series on a bounded pool of threads
+        toExport = [ result for result in results if result['source'] is not None ]
+        numExports = len( toExport )
+        pool = multiprocessing.pool.ThreadPool( max(1, numThreads) )
+        try:
+            for idx, result in enumerate( pool.imap_unordered(self.exportSeries, toExport) ):
+
+                # display progress
+                progress = (((idx + 1) * 100) / numExports)
+                sys.stdout.write( " Progress: %d%% \r" % progress )
+                sys.stdout.flush()
+
+        finally:
+            pool.close()
+            pool.join()
+
+        # progress
+        sys.stdout.write( "                         \r" )
+        sys.stdout.flush()
+
+        return results
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # streams many managed DICOM series into a 'tar', 'tar.gz', 'tar.zst', or 'zip' archive, without staging them on disk
+    # the archive can be a path or a file object (tar archives can be written to pipes, e.g. sys.stdout)
+    # returns a dict per series like exportMany, with directories in the archive as destinations
+    def exportArchive(self, recordIDs, archive, archiveFormat='tar', ageBreakdown=False, directoryTree=True, readableSeriesSlug=True):
+
+        # plan each series' export
+        results = [ { 'recordID': recordID, 'source': None, 'destination': None, 'status': 'error', 'message': None } for recordID in recordIDs ]
+
+        # find series records in SQLite database, all at once
+        seriesRecords = self.getSeriesRecords(recordIDs)
+
+        # open archive
+        try:
+            archiveWriter = dicomfiles.ArchiveWriter(archive, archiveFormat)
+        except Exception, e:
+            for result in results:
+                result['message'] = "Archive could not be opened: %s" % repr(e)
+            return results
+
+        try:
+            numRecords = len( results )
+            for idx, result in enumerate( results ):
+                recordID = result['recordID']
+                series = seriesRecords.get(recordID)
+                if series is None:
+                    # series not found in database
+                    result['message'] = "Series record with id %s not found!" % recordID
+                    continue
+
+                # compute source directory and directory in the archive
+                ageInDays = series['AgeInDays'] if ageBreakdown else None
+                srcSeriesDir, arcSeriesDir = self.exportPaths(series, '', ageInDays, ageBreakdown, directoryTree, readableSeriesSlug)
+                if srcSeriesDir is None:
+                    result['message'] = "Can't generate series directory of series with id %s." % recordID
+                    continue
+                result['source'] = srcSeriesDir
+                result['destination'] = arcSeriesDir = arcSeriesDir.lstrip(os.sep)
+
+                # check that source-series directory exists
+                if not os.path.exists( srcSeriesDir ):
+                    result['message'] = "Source series directory not found: %s" % srcSeriesDir
+                    continue
+
+                # stream series into archive - a series failing part way keeps the DICOMs streamed before
+                try:
+                    archiveWriter.addTree(srcSeriesDir, arcSeriesDir)
+                    result['status'] = 'exported'
+                except (IOError, OSError), e:
+                    result['message'] = "Failed to export series: %s" % repr(e)
+
+                # display progress
+                progress = (((idx + 1) * 100) / numRecords)
+                sys.stdout.write( " Progress: %d%% \r" % progress )
+                sys.stdout.flush()
+
+        finally:
+            archiveWriter.close()
+
+        # progress
+        sys.stdout.write( "                         \r" )
+        sys.stdout.flush()
+
+        return results
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # gets series' records by record ID in one query - keyed by the record IDs as given, e.g. as text
+    def getSeriesRecords ( self, recordIDs ):
+        seriesRecords = {}
+
+        # query in chunks to stay under SQLite's limit of query parameters
+        recordIDs = list(recordIDs)
+        chunkSize = 500
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.row_factory = None
+            for chunkIdx in xrange(0, len(recordIDs), chunkSize):
+                chunk = recordIDs[chunkIdx:chunkIdx + chunkSize]
+                qFind = "SELECT * FROM %s WHERE id IN ( %s )" % ( self.settings.dbTblSeries, ', '.join([ '?' for i in xrange(len(chunk)) ]) )
+                dbCur.execute( qFind, chunk )
+                fieldIndexes = self.seriesRecordFields( dbCur.description )
+                for values in dbCur.fetchall():
+                    series = SeriesRecord( fieldIndexes, values )
+                    seriesRecords[ series.recordID ] = series
+
+        # (SQLite compares record IDs given as text as numbers)
+        givenRecords = {}
+        for recordID in recordIDs:
+            try:
+                series = seriesRecords.get( int(recordID) )
+            except (TypeError, ValueError):
+                continue
+            if series is not None:
+                givenRecords[recordID] = series
+
+        return givenRecords
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # computes the source and destination directories of an exported series
+    def exportPaths ( self, dcm, dstRoot, ageInDays=None, ageBreakdown=False, directoryTree=True, readableSeriesSlug=True ):
+        os_path_join = os.path.join
+
+        # determine source-series directory
+        srcSeriesDir = self.storagePath(dcm, directory=True)
+        if srcSeriesDir is None:
+            return None, None
+
+        # option: do/don't breakdown exported DICOMs by age
+        if ageBreakdown:
+
+            # modify destination root directory accordingly
+            ageRange = self.ageBucket(ageInDays)
+            if ageRange is not None:
+                dstRoot = os_path_join(dstRoot, ageRange['name'])
+
+        # option: do/don't replicate storage file-tree for exported DICOMs
+        if directoryTree:
+            # create destination path
+            dstSeriesDir = srcSeriesDir.replace( self.settings.dicomDir, dstRoot )
+
+        else:
+            # create destination path
+            seriesSlug = os.path.basename(srcSeriesDir)
+            dstSeriesDir = os_path_join( dstRoot, seriesSlug )
+
+        # option: do/don't keep human readable series slug
+        if not readableSeriesSlug:
+
+            # alter destination path
+            dstSeriesDir = os_path_join( os.path.dirname(dstSeriesDir), dcm.SeriesInstanceUID )
+
+        return srcSeriesDir, dstSeriesDir
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # copies a managed DICOM series as planned by exportMany, filling in the result
+    def exportSeries ( self, result ):
+        srcSeriesDir = result['source']
+        dstSeriesDir = result['destination']
+
+        # check that source-series directory exists
+        if not os.path.exists( srcSeriesDir ):
+            result['message'] = "Source series directory not found: %s" % srcSeriesDir
+
+        # check that series destination doesn't exist yet
+        elif os.path.exists( dstSeriesDir ):
+            result['status'] = 'skipped'
+            result['message'] = "Destination series directory already exists, skipping: %s" % dstSeriesDir
+
+        else:
+            # copy source to destination - or link or clone it, as set in the settings
+            try:
+                dicomfiles.copyTree( srcSeriesDir, dstSeriesDir, self.settings.exportMethods )
+                result['status'] = 'exported'
+            except Exception, e:
+                result['message'] = "Failed to export series: %s" % repr(e)
+
+        return result
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # deletes managed DICOM files
+    def delete(self, recordIDs, wait=False):
+
+        # check if multiple series record IDs were provided
+        if isinstance(recordIDs, list):
+            self.deleteMany(recordIDs, wait)
+
+        # check for single series record ID
+        elif isinstance(recordIDs, int):
+            self.deleteMany([recordIDs], wait)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # deletes many managed DICOM series - their records, notes, and instances in one transaction,
+    # then their directories in the background (optionally wait for that to finish)
+    def deleteMany(self, recordIDs, wait=False):
+        tblSeries = self.settings.dbTblSeries
+        tblInstances = self.settings.dbTblInstances
+
+        # find series records in SQLite database, all at once
+        seriesRecords = self.getSeriesRecords(recordIDs)
+
+        # find storage directories
+        foundIDs = []
+        seriesUIDs = []
+        seriesDirs = []
+        for recordID in recordIDs:
+            series = seriesRecords.get(recordID)
+            if series is None:
+                # series not found in database
+                print "Can't delete series with id %s." % recordID
+                continue
+
+            foundIDs.append( recordID )
+            seriesUIDs.append( str(series['SeriesInstanceUID']) )
+            seriesDir = self.storagePath(series, directory=True)
+            if seriesDir == None:
+                # series storage directory not found
+                print "Can't delete series with id %s." % recordID
+
+            # check that storage directory exists
+            elif not os.path.exists( seriesDir ):
+                print "Can't delete DICOMs. Series directory not found: %s" % seriesDir
+
+            else:
+                seriesDirs.append( seriesDir )
+
+        # delete series records, and their notes, ingest ledger entries, and instances from database
+        unreferencedBlobs = []
+        chunkSize = 500
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            for chunkIdx in xrange(0, len(foundIDs), chunkSize):
+                chunk = foundIDs[chunkIdx:chunkIdx + chunkSize]
+                uidChunk = seriesUIDs[chunkIdx:chunkIdx + chunkSize]
+                params = ', '.join([ '?' for i in xrange(len(chunk)) ])
+                uidParams = ', '.join([ '?' for i in xrange(len(uidChunk)) ])
+
+                statsRows = self.selectStats(dbCur, 'id', chunk)
+                dbCur.execute( "SELECT DISTINCT BlobHash FROM %s WHERE SeriesId IN ( %s ) AND BlobHash IS NOT NULL" % ( tblInstances, params ), chunk )
+                blobHashes = [ row[0] for row in dbCur.fetchall() ]
+
+                dbCur.execute( "DELETE FROM %s WHERE SeriesInstanceUID IN ( %s )" % ( self.settings.dbTblSeriesNotes, uidParams ), uidChunk )
+                dbCur.execute( "DELETE FROM %s WHERE SeriesInstanceUID IN ( %s )" % ( self.settings.dbTblNoteTags, uidParams ), uidChunk )
+                dbCur.execute( "DELETE FROM %s WHERE SeriesInstanceUID IN ( %s )" % ( self.settings.dbTblIngestLedger, uidParams ), uidChunk )
+                dbCur.execute( "DELETE FROM %s WHERE SeriesId IN ( %s )" % ( tblInstances, params ), chunk )
+                unreferencedBlobs.extend( self.countBlobRefs(dbCur, blobHashes) )
+                if self.seriesSearch:
+                    dbCur.execute( "DELETE FROM %s WHERE rowid IN ( %s )" % ( self.settings.dbTblSeriesSearch, params ), chunk )
+                dbCur.execute( "DELETE FROM %s WHERE id IN ( %s )" % ( tblSeries, params ), chunk )
+                self.countStats( dbCur, statsRows, -1 )
+
+        # forget series' cached record IDs and storage directories
+        for seriesUID in seriesUIDs:
+            self.seriesIdCache.pop(seriesUID, None)
+            self.seriesDirCache.pop(seriesUID, None)
+
+        # delete series directories and blobs no longer referenced by any instance, in the background
+        blobPaths = [ self.blobPath(blobHash) for blobHash in unreferencedBlobs ]
+        self.removeInBackground( seriesDirs + blobPaths )
+        if wait:
+            self.waitForRemovals()
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # removes files and directory trees on background threads, first moving them to the trash directory if set
+    def removeInBackground ( self, paths ):
+        if not paths:
+            return
+
+        # option - move to the trash directory, so they're out of the managed filetree immediately
+        if self.settings.deleteToTrash:
+            trashDir = self.settings.trashDir
+            if not os.path.isdir(trashDir):
+                os.makedirs(trashDir)
+
+            trashPaths = []
+            for path in paths:
+                try:
+                    trashPath = os.path.join( tempfile.mkdtemp(dir=trashDir), os.path.basename(path) )
+                    os.rename(path, trashPath)
+                    trashPaths.append( os.path.dirname(trashPath) )
+                except OSError:
+                    # e.g. trash directory on another filesystem - remove in place
+                    trashPaths.append( path )
+            paths = trashPaths
+
+        # start removal threads once per manager - daemons waiting for paths, so removals are waited for at exit instead
+        if getattr(self, 'removalQueue', None) is None:
+            self.removalQueue = Queue.Queue()
+            self.removalThreads = []
+            for i in xrange( max(1, self.settings.deleteThreads) ):
+                thread = threading.Thread( target=self.removeQueued )
+                thread.daemon = True
+                thread.start()
+                self.removalThreads.append(thread)
+            atexit.register( self.waitForRemovals )
+
+        # queue paths for removal
+        for path in paths:
+            self.removalQueue.put(path)
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # removal thread - removes queued files and directory trees, marking each done for waitForRemovals()
+    def removeQueued ( self ):
+        while True:
+            path = self.removalQueue.get()
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except Exception, e:
+                print repr(e)
+                print "Failed to remove: %s" % path
+            finally:
+                self.removalQueue.task_done()
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # waits for background removals to finish, including paths queued while waiting
+    def waitForRemovals ( self ):
+        if getattr(self, 'removalQueue', None) is not None:
+            self.removalQueue.join()
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # checks the managed filetree against the database, finding series whose directory holds a different number of DICOMs
+    # than recorded ('counts'), series with stored DICOMs whose directory is missing ('missing'), and series directories
+    # without a series record ('orphans'). Option, repairs them (True, or a list of the kinds to repair):
+    #   'counts'  - sets the series' numbers of DICOMs to the numbers found
+    #   'missing' - sets the series' numbers of DICOMs to 0, and forgets their stored instances and source files,
+    #               so managing their source DICOMs again stores them again
+    #   'orphans' - records the orphaned series from the DICOMs in their directories, where they are - skipping DICOMs
+    #               not at their storage path, and series recorded in another directory
+    # option, only lists series directories again if modified since the last check
+    # returns the problems found by kind: lists of dicts of recordID, SeriesInstanceUID, seriesDir, recorded and found
+    # numbers of DICOMs - and, for orphans, a list of series directories
+    def verify ( self, repair=False, incremental=False, numThreads=None ):
+        if repair is True:
+            repair = [ 'counts', 'missing', 'orphans' ]
+        elif not repair:
+            repair = []
+
+        # walk the filetree, and compare it with the database
+        seriesDirs = self.scanTree( incremental, numThreads )
+        problems = self.checkTree( seriesDirs )
+        print "Checked %d series directories: %d with a different number of DICOMs than recorded, %d missing, %d orphaned." % (
+            len(seriesDirs), len(problems['counts']), len(problems['missing']), len(problems['orphans']) )
+
+        # option - record orphaned series from their DICOMs, where they are
+        if 'orphans' in repair and problems['orphans']:
+            recordedDirs = self.recordOrphans( problems['orphans'] )
+            if len(recordedDirs) < len(problems['orphans']):
+                print "%d orphaned series directories could not be recorded." % ( len(problems['orphans']) - len(recordedDirs) )
+
+        # option - repair numbers of DICOMs
+        if 'counts' in repair:
+            self.repairCounts( problems['counts'] )
+
+        # option - forget stored DICOMs of series whose directory is missing
+        if 'missing' in repair:
+            self.repairCounts( problems['missing'], forgetInstances=True )
+
+        return problems
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # records orphaned series directories' DICOMs as stored where they are, in batches as they're read - only DICOMs at the
+    # storage path computed for them, of series not recorded elsewhere (they aren't stored again, nor remembered as ingested)
+    # returns the directories whose DICOMs were recorded
+    def recordOrphans ( self, orphanDirs, numWorkers=None ):
+
+        # number of processes reading DICOMs
+        if numWorkers is None:
+            numWorkers = self.settings.manageWorkers
+
+        dcmPaths = []
+        for seriesDir in orphanDirs:
+            dcmPaths.extend( fullPath for name, fullPath, isFile, isDir in self.listDir(seriesDir) if isFile and name.endswith('.dcm') )
+
+        batchSize = self.settings.manageBatchSize
+        orphanSeries = set()
+        recordedDirs = set()
+        batch = []
+        for dcmPath, dcm in self.iterRead(dcmPaths, numWorkers):
+            if dcm is None:
+                print "Couldn't read. Unable to record DICOM: %s" % dcmPath
+            else:
+                batch.append(dcm)
+
+            if len(batch) >= batchSize:
+                recordedDirs.update( self.recordOrphanBatch(batch, orphanSeries) )
+                batch = []
+
+        # record the last batch
+        if batch:
+            recordedDirs.update( self.recordOrphanBatch(batch, orphanSeries) )
+
+        return recordedDirs
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # records a batch of orphaned DICOMs for recordOrphans(), given the series it recorded so far - returns their directories
+    def recordOrphanBatch ( self, dcms, orphanSeries ):
+        seriesIdCache = self.seriesIdCache
+
+        # skip series recorded before, whose directory is elsewhere
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            self.refreshSeriesIds( dbCur, set( str(dcm.SeriesInstanceUID) for dcm in dcms ) - orphanSeries )
+        orphans = []
+        for dcm in dcms:
+            seriesUID = str( dcm.SeriesInstanceUID )
+            if seriesUID not in orphanSeries and seriesIdCache.get(seriesUID) is not None:
+                print "Series recorded in another directory. Unable to record DICOM: %s" % dcm.path
+                continue
+
+            # skip DICOMs not where they'd be stored
+            storeDst = self.storagePath(dcm)
+            if storeDst is None or os.path.normpath( os.path.abspath(storeDst) ) != os.path.normpath( os.path.abspath(dcm.path) ):
+                print "DICOM not at its storage path. Unable to record DICOM: %s" % dcm.path
+                continue
+            orphans.append( dcm )
+
+        # record series
+        recordIDs = self.recordMany( orphans )
+        orphans = [ dcm for dcm, recordID in zip(orphans, recordIDs) if recordID is not None ]
+        orphanSeries.update( str(dcm.SeriesInstanceUID) for dcm in orphans )
+
+        # record instances at their paths, and count them per series
+        numStored = {}
+        for dcm in orphans:
+            seriesUID = str( dcm.SeriesInstanceUID )
+            numStored[seriesUID] = numStored.get(seriesUID, 0) + 1
+        if orphans:
+            with self.dbCon:
+                dbCur = self.dbCon.cursor()
+                self.recordInstances(dbCur, [ (dcm, dcm.path, None) for dcm in orphans ])
+                dbCur.executemany( "UPDATE %s SET NumberOfDicoms = NumberOfDicoms + ? WHERE SeriesInstanceUID = ?" % self.settings.dbTblSeries, [ (num, seriesUID) for seriesUID, num in numStored.iteritems() ] )
+                self.countStatsDicoms(dbCur, numStored)
+
+        return set( os.path.dirname( os.path.normpath( os.path.abspath(dcm.path) ) ) for dcm in orphans )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # walks the managed filetree one level at a time, listing each level's directories on a pool of threads -
+    # returns the number of DICOMs in each series directory (i.e. directories with DICOMs), by normalized path
+    # option, series directories not modified since the last check aren't listed again
+    def scanTree ( self, incremental=False, numThreads=None ):
+        tblTreeChecks = self.settings.dbTblTreeChecks
+
+        # number of threads listing directories
+        if numThreads is None:
+            numThreads = self.settings.verifyThreads
+
+        # series directories found by the last check
+        checkedDirs = {}
+        if incremental:
+            with self.dbCon:
+                dbCur = self.dbCon.cursor()
+                dbCur.execute( "SELECT SeriesDir, ModifiedTime, NumberOfDicoms FROM %s" % tblTreeChecks )
+                checkedDirs = dict( ( row[0], ( row[1], row[2] ) ) for row in dbCur.fetchall() )
+
+        # list directories, level by level, skipping the blob storage
+        blobDir = os.path.normpath( os.path.abspath(self.settings.blobDir) )
+        seriesDirs = {}
+        checks = []
+        dirs = [ os.path.normpath( os.path.abspath(self.settings.dicomDir) ) ]
+        pool = multiprocessing.pool.ThreadPool( max(1, numThreads) )
+        try:
+            while dirs:
+                subDirs = []
+                for dirPath, modifiedTime, numDicoms, dirSubDirs in pool.imap_unordered( self.scanDir, [ (dirPath, checkedDirs.get(dirPath)) for dirPath in dirs ], 16 ):
+                    if numDicoms:
+                        seriesDirs[dirPath] = numDicoms
+                        if not dirSubDirs:
+                            checks.append( (dirPath, modifiedTime, numDicoms) )
+                    subDirs.extend( subDir for subDir in dirSubDirs if subDir != blobDir )
+                dirs = subDirs
+
+                # display progress
+                sys.stdout.write( " Found %d series directories\r" % len(seriesDirs) )
+                sys.stdout.flush()
+
+        finally:
+            pool.close()
+            pool.join()
+
+        sys.stdout.write( "                                        \r" )
+        sys.stdout.flush()
+
+        # remember the series directories found, for incremental checks
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "DELETE FROM %s" % tblTreeChecks )
+            dbCur.executemany( "INSERT INTO %s ( SeriesDir, ModifiedTime, NumberOfDicoms ) VALUES ( ?, ?, ? )" % tblTreeChecks, checks )
+
+        return seriesDirs
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # lists a directory of the managed filetree, given with its ( modification time, number of DICOMs ) from the last check if any,
+    # returning its path, modification time, number of DICOMs and subdirectories - a directory not modified since isn't listed
+    def scanDir ( self, dirCheck ):
+        dirPath, lastCheck = dirCheck
+        try:
+            modifiedTime = os.stat(dirPath).st_mtime
+            if lastCheck is not None and lastCheck[0] == modifiedTime:
+                return dirPath, modifiedTime, lastCheck[1], []
+
+            numDicoms = 0
+            subDirs = []
+            for name, fullPath, isFile, isDir in self.listDir(dirPath):
+                if isDir:
+                    subDirs.append( fullPath )
+                elif isFile and name.endswith('.dcm'):
+                    numDicoms += 1
+
+        except OSError, e:
+            print repr(e)
+            print "Directory could not be checked: %s" % dirPath
+            return dirPath, None, 0, []
+
+        return dirPath, modifiedTime, numDicoms, subDirs
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # compares the series directories found in the managed filetree, with their numbers of DICOMs, with the series records
+    # returns the problems found, as in verify()
+    def checkTree ( self, seriesDirs ):
+        problems = { 'counts': [], 'missing': [], 'orphans': [] }
+
+        # each series' directory, where its recorded DICOMs should be
+        recordedDirs = set()
+        for series in self.iterSeries():
+            seriesDir = self.storagePath(series, directory=True)
+            if seriesDir is None:
+                continue
+            seriesDir = os.path.normpath( os.path.abspath(seriesDir) )
+            recordedDirs.add( seriesDir )
+
+            numFound = seriesDirs.get( seriesDir, 0 )
+            if numFound != series['NumberOfDicoms']:
+                problem = { 'recordID': series['id'], 'SeriesInstanceUID': str(series['SeriesInstanceUID']), 'seriesDir': seriesDir,
+                            'recorded': series['NumberOfDicoms'], 'found': numFound }
+                problems[ 'counts' if seriesDir in seriesDirs else 'missing' ].append( problem )
+
+        # series directories without a series record
+        problems['orphans'] = sorted( set(seriesDirs) - recordedDirs )
+
+        return problems
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # sets series' numbers of DICOMs to the numbers found in their directories, given as problems from checkTree()
+    # option, also forgets the series' stored instances and ingested source files
+    def repairCounts ( self, problems, forgetInstances=False ):
+        if not problems:
+            return
+        tblInstances = self.settings.dbTblInstances
+
+        unreferencedBlobs = []
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+
+            # update numbers of DICOMs, and the summary statistics
+            dbCur.executemany( "UPDATE %s SET NumberOfDicoms = ? WHERE id = ?" % self.settings.dbTblSeries, [ (problem['found'], problem['recordID']) for problem in problems ] )
+            numStored = {}
+            for problem in problems:
+                numStored[ problem['SeriesInstanceUID'] ] = numStored.get( problem['SeriesInstanceUID'], 0 ) + problem['found'] - problem['recorded']
+            self.countStatsDicoms(dbCur, numStored)
+
+            # option - forget stored instances, and ingested source files so they're managed again, in chunks
+            if forgetInstances:
+                chunkSize = 500
+                for chunkIdx in xrange(0, len(problems), chunkSize):
+                    chunk = [ problem['recordID'] for problem in problems[chunkIdx:chunkIdx + chunkSize] ]
+                    uidChunk = [ problem['SeriesInstanceUID'] for problem in problems[chunkIdx:chunkIdx + chunkSize] ]
+                    params = ', '.join([ '?' for i in xrange(len(chunk)) ])
+
+                    dbCur.execute( "SELECT DISTINCT BlobHash FROM %s WHERE SeriesId IN ( %s ) AND BlobHash IS NOT NULL" % ( tblInstances, params ), chunk )
+                    blobHashes = [ row[0] for row in dbCur.fetchall() ]
+                    dbCur.execute( "DELETE FROM %s WHERE SeriesInstanceUID IN ( %s )" % ( self.settings.dbTblIngestLedger, params ), uidChunk )
+                    dbCur.execute( "DELETE FROM %s WHERE SeriesId IN ( %s )" % ( tblInstances, params ), chunk )
+                    unreferencedBlobs.extend( self.countBlobRefs(dbCur, blobHashes) )
+
+        # delete blobs no longer referenced by any instance, in the background
+        self.removeInBackground([ self.blobPath(blobHash) for blobHash in unreferencedBlobs ])
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # records notes about DICOM series, and the hashtags in them, in one transaction
+    def note(self, seriesInstanceUIDs, note):
+            
+        # check for series IDs list
+        if not isinstance( seriesInstanceUIDs, list ):
+            print "Error! Must provide a list of series IDs"
+            return
+        
+        # check that series IDs list is not empty
+        numIds = len( seriesInstanceUIDs )
+        if numIds == 0:
+            print "No series IDs provided!"
+            return
+
+        # parse the note's hashtags
+        tags = self.noteTags(note)
+
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+
+            # record notes
+            tblNotes = self.settings.dbTblSeriesNotes
+            dbCur.executemany( "INSERT INTO %s ( SeriesInstanceUID, Note ) VALUES ( ?, ? )" % tblNotes, [ (seriesInstanceUID, note) for seriesInstanceUID in seriesInstanceUIDs ] )
+
+            # find the notes' IDs - the last ones assigned, as the transaction holds the database's write lock
+            dbCur.execute( "SELECT MAX(id) FROM %s" % tblNotes )
+            firstNoteId = dbCur.fetchone()[0] - numIds + 1
+
+            # record hashtags
+            noteTags = []
+            for idx, seriesInstanceUID in enumerate( seriesInstanceUIDs ):
+                for tag, value in tags:
+                    noteTags.append( (firstNoteId + idx, seriesInstanceUID, tag, value) )
+            dbCur.executemany( "INSERT INTO %s ( NoteId, SeriesInstanceUID, Tag, Value ) VALUES ( ?, ?, ?, ? )" % self.settings.dbTblNoteTags, noteTags )
+
+            # index notes for full-text search
+            self.updateSeriesSearch( dbCur, list( set( seriesInstanceUIDs ) ) )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # parses the hashtags in a note, as a list of ( tag, value ) tuples - the value is None for tags without one
+    def noteTags ( self, note ):
+        if not note:
+            return []
+        return [ (tag, value or None) for tag, value in noteTagPattern.findall(note) ]
+
+            
+            
+    #--------------------------------------------------------------------------------------------
+    # deletes DICOM series notes, and their hashtags
+    def deleteNotes(self, noteIds):
+            
+        # check for series IDs list
+        if not isinstance( noteIds, list ):
+            print "Error! Must provide a list of series IDs"
+            return
+        
         # check that at least 1 series ID was provided
         numIds = len( noteIds )
         if numIds == 0:
             print "No series IDs provided!"
             return
         
-        # loop through list of series ids
-        for noteId in noteIds:
+        # delete notes, in chunks
+        chunkSize = 500
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            for chunkIdx in xrange(0, numIds, chunkSize):
+                chunk = noteIds[chunkIdx:chunkIdx + chunkSize]
+                params = ', '.join([ '?' for i in xrange(len(chunk)) ])
+                dbCur.execute( "SELECT DISTINCT SeriesInstanceUID FROM %s WHERE id IN ( %s )" % ( self.settings.dbTblSeriesNotes, params ), chunk )
+                seriesUIDs = [ row[0] for row in dbCur.fetchall() ]
+                dbCur.execute( "DELETE FROM %s WHERE NoteId IN ( %s )" % ( self.settings.dbTblNoteTags, params ), chunk )
+                dbCur.execute( "DELETE FROM %s WHERE id IN ( %s )" % ( self.settings.dbTblSeriesNotes, params ), chunk )
+
+                # remove notes from full-text search index
+                self.updateSeriesSearch( dbCur, seriesUIDs )
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # finds the record IDs of series noted with all of the included hashtags and none of the excluded ones
+    # (hashtags are given as in notes, e.g. '#reviewed' matches any value, '#quality:3' only that value)
+    def getTaggedSeries ( self, include=[], exclude=[] ):
+        tblNoteTags = self.settings.dbTblNoteTags
+
+        # build a subquery, using the hashtag index, for each hashtag (ignoring notes without series, which break NOT IN)
+        conditions = []
+        params = []
+        for tagSpecs, operator in ( (include, 'IN'), (exclude, 'NOT IN') ):
+            if isinstance(tagSpecs, basestring):
+                tagSpecs = [tagSpecs]
+            for tagSpec in tagSpecs:
+                tags = self.noteTags(tagSpec if tagSpec.startswith('#') else '#' + tagSpec)
+                if len(tags) != 1:
+                    print "Invalid hashtag: %s" % tagSpec
+                    return None
+                tag, value = tags[0]
+                if value is None:
+                    conditions.append( "SeriesInstanceUID %s ( SELECT SeriesInstanceUID FROM %s WHERE Tag=? AND SeriesInstanceUID IS NOT NULL )" % ( operator, tblNoteTags ) )
+                    params.append( tag )
+                else:
+                    conditions.append( "SeriesInstanceUID %s ( SELECT SeriesInstanceUID FROM %s WHERE Tag=? AND Value=? AND SeriesInstanceUID IS NOT NULL )" % ( operator, tblNoteTags ) )
+                    params.extend( (tag, value) )
+
+        # find series
+        query = "SELECT id FROM %s" % self.settings.dbTblSeries
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( query + " ORDER BY id", params )
+            return [ row[0] for row in dbCur.fetchall() ]
+
+
+
+    #--------------------------------------------------------------------------------------------
+    # finds the record IDs of series matching a full-text search of their descriptions, protocol names, and notes
+    # (FTS5 query syntax - e.g. 'mprage', 'SeriesDescription:mprage NOT gad', 'brav*', '"post contrast"')
+    def search ( self, query, limit=None ):
+
+        # check for full-text search index
+        if not self.seriesSearch:
+            print "Series search is not available. SQLite's FTS5 extension is needed."
+            return None
+
+        qSearch = "SELECT rowid FROM %s WHERE %s MATCH ? ORDER BY rowid" % ( self.settings.dbTblSeriesSearch, self.settings.dbTblSeriesSearch )
+        params = [query]
+        if limit is not None:
+            qSearch += " LIMIT ?"
+            params.append(limit)
 
-            # check that series is owned by this project
+        try:
             with self.dbCon:
                 dbCur = self.dbCon.cursor()
+                dbCur.execute( qSearch, params )
+                return [ row[0] for row in dbCur.fetchall() ]
+        except sqlite3.OperationalError, e:
+            # e.g. query syntax error
+            print repr(e)
+            print "Invalid series search: %s" % query
+            return None
 
-                # delete note
-                dbCur.execute( "DELETE FROM %s WHERE id = ?" % self.settings.dbTblSeriesNotes, (noteId,) )
 
 
-                    
\ No newline at end of file
+    #--------------------------------------------------------------------------------------------
+    # gets summary statistics of the managed series, from the incrementally maintained statistics table:
+    # for the whole archive, a dict of NumberOfSeries, NumberOfDicoms, NumberOfStudies, and NumberOfPatients, or
+    # given a dimension (a column set in the settings, e.g. 'Modality'), a list of such dicts with the Value, most series first
+    def getStats ( self, dimension=None ):
+        counts = [ 'NumberOfSeries', 'NumberOfDicoms', 'NumberOfStudies', 'NumberOfPatients' ]
+
+        # check dimension
+        if dimension is not None and dimension not in self.statsColumns():
+            print "No statistics of column: %s" % dimension
+            return None
+
+        with self.dbCon:
+            dbCur = self.dbCon.cursor()
+            dbCur.execute( "SELECT Value, %s FROM %s WHERE Dimension = ? ORDER BY NumberOfSeries DESC, Value" % ( ', '.join(counts), self.settings.dbTblStats ), (dimension or '',) )
+            rows = dbCur.fetchall()
+
+        # whole archive
+        if dimension is None:
+            if not rows:
+                return dict( (count, 0) for count in counts )
+            return dict( (count, rows[0][count]) for count in counts )
+
+        return [ dict( (key, row[key]) for key in ['Value'] + counts ) for row in rows ]
@@ -28,6 +28,48 @@ class DicomManagerSettings:
                 
         # set name of database table in which the series' notes are saved
         self.dbTblSeriesNotes = 'Notes'
+
+        # set name of database table in which the hashtags parsed from the series' notes are saved
+        self.dbTblNoteTags = 'NoteTags'
+
+        # set name of the full-text search index of the series' descriptions and notes
+        self.dbTblSeriesSearch = 'SeriesSearch'
+
+        # set name of database table in which the summary statistics of the series are saved
+        self.dbTblStats = 'Stats'
+
+        # set name of database table in which the schema version is saved
+        self.dbTblSchemaVersion = 'SchemaVersion'
+
+        # set name of database table in which the stored dicom instances are saved
+        self.dbTblInstances = 'Instances'
+
+        # set name of database table in which the content-addressed blobs are saved
+        self.dbTblBlobs = 'Blobs'
+
+        # set name of database table in which managed source files are saved
+        self.dbTblIngestLedger = 'IngestLedger'
+
+        # set name of database table in which the series table's columns waiting to be backfilled are saved
+        self.dbTblBackfills = 'Backfills'
+
+        # set name of database table in which the series each of these columns is yet to be backfilled for are saved
+        self.dbTblBackfillSeries = 'BackfillSeries'
+
+        # set name of database table in which the series directories found by the last check of the filetree are saved
+        self.dbTblTreeChecks = 'TreeChecks'
+
+        # set the series table's columns to index, in addition to SeriesInstanceUID - a column, or a tuple of columns
+        # (numeric acquisition parameters are indexed with the field strength, for range queries at a given field strength)
+        self.dbSeriesIndexes = [ 'AccessionNumber', 'PatientID', 'StudyInstanceUID',
+                                 ('MagneticFieldStrength', 'RepetitionTime'), ('MagneticFieldStrength', 'EchoTime'),
+                                 ('MagneticFieldStrength', 'InversionTime'), 'SliceThickness' ]
+
+        # set the series table's columns in the full-text search index, along with the series' notes
+        self.dbSearchColumns = [ 'SeriesDescription', 'StudyDescription', 'ProtocolName' ]
+
+        # set the series table's columns summarized in the statistics table (rebuild it after changing these)
+        self.statsColumns = [ 'Modality', 'Manufacturer', 'ManufacturerModelName', 'InstitutionName', 'MagneticFieldStrength' ]
     
         # set the root directory of DICOM storage
         self.rootDir = os.path.join( selfDir, 'data' )
@@ -36,8 +78,80 @@ class DicomManagerSettings:
     
         # set the directory where the dicoms are acutally written
         self.dicomDir = os.path.join( self.rootDir, 'DICOM' )
+
+        # set the file name extensions of DICOM files to find
+        self.findExtensions = [ '.dcm', '.dicom' ]
+
+        # set whether finding DICOMs also checks the content of files without those extensions (e.g. bare UID file names)
+        self.findSniff = False
+
+        # set whether that check also probes for DICOMs without the 128-byte preamble (slower, less certain)
+        self.findSniffNoPreamble = False
+
+        # set whether finding DICOMs lists the instances of directories with a DICOMDIR index instead of searching them
+        self.findUseDicomDir = False
+
+        # set whether stored DICOMs' content is kept once per unique content in the blob directory,
+        # with the managed filetree's files linked to it
+        self.blobStorage = False
+
+        # set the directory where the content-addressed blobs are written
+        self.blobDir = os.path.join( self.dicomDir, '.blobs' )
+
+        # set whether deleted DICOMs are first moved to the trash directory, then removed in the background
+        self.deleteToTrash = True
+
+        # set the trash directory, which should be on the same filesystem as the DICOM storage directory
+        self.trashDir = os.path.join( self.rootDir, 'Trash' )
+
+        # set the number of threads removing deleted DICOMs in the background
+        self.deleteThreads = 4
+
+        # set the number of processes reading DICOMs during management (1 reads them in this process)
+        self.manageWorkers = 1
+
+        # set the maximum number of DICOMs being read ahead of the database writer
+        self.manageQueueSize = 256
+
+        # set the number of DICOMs recorded and stored per database transaction during management
+        self.manageBatchSize = 500
+
+        # set the number of processes reading DICOMs when backfilling columns added to the tags to record
+        self.backfillWorkers = 4
+
+        # set the number of series backfilled per database transaction
+        self.backfillBatchSize = 500
+
+        # set whether management skips source files unchanged since they were last recorded and stored
+        self.manageSkipUnchanged = True
+
+        # set how DICOMs are stored in the managed filetree, in order of preference, falling back to the next on failure:
+        #   'rename' (only when the source DICOMs are deleted), 'hardlink' (shares the file with its source),
+        #   'reflink' (copy-on-write clone, e.g. btrfs or xfs), 'copy'
+        self.storeMethods = [ 'rename', 'reflink', 'copy' ]
+
+        # set how DICOMs are exported, in order of preference (see storeMethods; 'rename' doesn't apply)
+        self.exportMethods = [ 'reflink', 'copy' ]
+
+        # set the number of threads copying series during export
+        self.exportThreads = 4
+
+        # set the number of threads listing directories when checking the filetree against the database
+        self.verifyThreads = 8
+
+        # set whether to read only the header tags used by the manager (skips pixel data)
+        self.readHeaderOnly = True
+
+        # set the size in bytes above which header values are left in the file until accessed
+        self.readDeferSize = 1024
+
+        # set how deep nested sequences are recorded (deeper sequences are recorded as their number of items)
+        self.sequenceMaxDepth = 2
+
+        # set the maximum size in characters of a recorded sequence (None for no limit) - further items are left out
+        self.sequenceMaxSize = 4096
                 
-        # set ranges for age breakdown
+        # set ranges for age breakdown, in days (inclusive, not overlapping)
         self.ageBreakdown = [
             {
                 'minDay': 0,
@@ -111,7 +225,7 @@ class DicomManagerSettings:
             },
             {
                 'minDay': 330,
-                'maxDay': 365,
+                'maxDay': 364,
                 'name': 'day0330-0364_month11_year0'
             },
             {
@@ -246,6 +360,43 @@ class DicomManagerSettings:
             },
         ]
 
+        # set name of database table in which the series' features are saved
+        self.dbTblFeatures = 'Features'
+
+        # set the number of series classified per batch when computing features
+        self.featuresBatchSize = 10000
+
+        # set the series features computed by classification rules - each feature is a column of the features table,
+        # labelling series by the first rule matching their value of the given series table column
+        # rules' patterns are SQL LIKE patterns ('%' any characters, '_' one character, case insensitive):
+        #   'include' - the value must match one of these
+        #   'require' - and, if given, one of these too
+        #   'exclude' - and none of these
+        contrastPatterns = [ '%POST%GAD%', '%POST%GD%', '%+GAD%', '%+GD%', '%POST%CC%', '%+C%', '%+ C%', '%C+%',
+                             '%POST%INJ%', '%FOLLOW%INJ%', '%+%CC%', '%CC', '%+%ml%' ]
+        self.features = [
+            {
+                'name': 'SeriesClass',
+                'column': 'SeriesDescription',
+                'rules': [
+                    { 'label': '#MPRAGE',  'include': [ '%MPRAGE%', '%MP RAGE%' ], 'exclude': [ '%TOF%', '%FSPGR%' ] + contrastPatterns },
+                    { 'label': '#SPGR',    'include': [ '%SPGR%' ],                'exclude': [ '%TOF%', '%FSPGR%' ] + contrastPatterns },
+                    { 'label': '#BRAVO',   'include': [ '%BRAVO%' ],               'exclude': [ '%TOF%', '%FSPGR%' ] + contrastPatterns },
+                    { 'label': '#DWI',     'include': [ '%DTI%', '%DWI%', '%Diffusion%' ], 'exclude': [ '%ADC%', '%TRACE%', '%EXP%', '%FA%', '%LOWB%' ] },
+                    { 'label': '#DWI_FA',  'include': [ 'FA', 'FA %', '_FA' ] },
+                    { 'label': '#DWI_FA',  'include': [ '%FA%' ], 'require': [ '%DWI%', '%DIFFUSION%', '%DTI%' ], 'exclude': [ '%FaReg%', '%FacReg%', '%FaDTI%', '%FacDTI%' ] },
+                    { 'label': '#DWI_ADC', 'include': [ '%ADC%' ] },
+                ]
+            },
+            {
+                'name': 'Contrast',
+                'column': 'SeriesDescription',
+                'rules': [
+                    { 'label': '#contrast', 'include': contrastPatterns },
+                ]
+            },
+        ]
+
         # list of all the dicom tags that will be recorded in the SQLite database
         self.tagsToRecord = [
             0x00080008, #Image Type
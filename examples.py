@@ -2,6 +2,7 @@
 # Here are some example use cases of how to use
 
 # instantiate
+import sys
 import dicommanager
 M = dicommanager.DicomManager()
 
@@ -12,10 +13,28 @@ dcmPaths = M.find( dcmDir, recursive=True )
 dcmPath = dcmPaths[0]
 
 
+# find DICOMs, including files without a DICOM extension (e.g. bare UID file names) by checking their content
+dcmPaths = list( M.iterFind( dcmDir, recursive=True, sniff=True ) )
+
+
+# check if a file is DICOM by its preamble, or list the DICOMs indexed by a DICOMDIR
+M.isDicom( '/path/to/1.2.840.113619.2.135.2025.2073408.4720.1102388196.444' )
+M.readDicomDir( '/path/to/cd/DICOMDIR' )
+
+
+# find DICOMs lazily, one at a time as the directory tree is searched
+for dcmPath in M.iterFind( dcmDir, recursive=True ):
+    print dcmPath
+
+
 # read DICOM into pydicom object
 dcm = M.read( dcmPath )
 
 
+# read the whole DICOM, including pixel data and tags the manager doesn't use
+dcm = M.read( dcmPath, headerOnly=False )
+
+
 # record DICOM series data in SQLite database
 M.record( dcm )
 
@@ -24,10 +43,28 @@ M.record( dcm )
 M.store( dcm )
 
 
+# record and store many DICOMs, one database transaction each
+dcms = [ M.read( dcmPath ) for dcmPath in dcmPaths[:100] ]
+M.recordMany( dcms )
+M.storeMany( dcms )
+
+
 # manage DICOMs = read, record, store, optionally delete original
 M.manage( dcmPaths=dcmPaths, deleteDcm=False, recordDcm=True, storeDcm=True )
 
 
+# manage DICOMs as they are found, without waiting for the search to finish
+M.manage( dcmPaths=M.iterFind( dcmDir ) )
+
+
+# manage DICOMs again, including those unchanged since they were last managed (skipped by default)
+M.manage( dcmPaths=dcmPaths, skipUnchanged=False )
+
+
+# manage DICOMs reading them in 4 worker processes (default number is set in dicommanagersettings.py)
+M.manage( dcmPaths=dcmPaths, numWorkers=4 )
+
+
 # get a pydicom object loaded with the series' record from the database (various args)
 dcm = M.getSeriesRecord( recordID=1 )
 M.getSeriesRecord( seriesUID="1.2.840.113619.2.135.2025.2073408.4720.1102388196.443" )
@@ -37,6 +74,22 @@ M.getSeriesRecord( patientID=7654321 )
 M.getSeriesRecord( patientID="7654321" )
 
 
+# stream all series matching column filters as lightweight records, without building pydicom objects
+# (a value, a list of values, or None for no value)
+for series in M.iterSeries( PatientID="7654321", Modality=['MR', 'CT'] ):
+    print series.recordID, series.SeriesDescription, series['NumberOfDicoms']
+
+# convert a record to a pydicom object, when one is needed
+dcm = M.recordToDataset( series )
+
+# stream series by patient age in days at scan time (inclusive range, using the AgeInDays index)
+week0Series = list( M.iterSeries( minAgeInDays=0, maxAgeInDays=6, Modality='MR' ) )
+
+# stream series by ranges of numeric acquisition parameters (stored as numbers, and indexed with the field strength)
+for series in M.iterSeries( MagneticFieldStrength=3, ranges={ 'RepetitionTime': (1800, 2500), 'EchoTime': (None, 5) } ):
+    print series.recordID, series.SeriesDescription
+
+
 # get the path to a stored series' directory in the managed filetree (various args)
 M.getSeriesDir( recordID=1 )
 M.getSeriesDir( seriesUID="1.2.840.113619.2.135.2025.2073408.4720.1102388196.443" )
@@ -46,12 +99,36 @@ M.getSeriesDir( patientID=7654321 )
 M.getSeriesDir( patientID="7654321" )
 
 
+# get the recorded instances of a stored series, and its number of instances and size in bytes
+M.getSeriesInstances( recordID=1 )
+M.getSeriesSize( recordID=1 )
+
+
 # copy selected series in the managed filetree to a location of choice
 recordIDs = [1,2,3,4,5,6,7,8,9]
 dstRoot = "/some/other/location"
 M.export( recordIDs=recordIDs, dstRoot=dstRoot, ageBreakdown=False, directoryTree=True, readableSeriesSlug=True )
 
 
+# export copies series concurrently, and returns each series' result
+results = M.export( recordIDs=recordIDs, dstRoot=dstRoot, numThreads=8 )
+for result in results:
+    if result['status'] != 'exported':
+        print result['recordID'], result['status'], result['message']
+
+
+# store each unique DICOM content once, linking the managed filetree's files to it, and export by linking too
+M.settings.blobStorage = True
+M.settings.exportMethods = [ 'hardlink', 'copy' ]
+M.manage( dcmPaths=dcmPaths )
+M.export( recordIDs=recordIDs, dstRoot=dstRoot )
+
+
+# stream selected series into an archive ('tar', 'tar.gz', 'tar.zst', or 'zip') instead of a directory
+M.export( recordIDs=recordIDs, dstRoot="/some/other/location/cohort.tar.gz", archiveFormat='tar.gz', ageBreakdown=True )
+M.export( recordIDs=recordIDs, dstRoot=sys.stdout, archiveFormat='tar' )
+
+
 # delete a DICOM series from the managed filetree along with its database record
 recordID = 1
 M.delete( recordID )
@@ -61,6 +138,9 @@ M.delete( recordID )
 recordIDs = [1,2,3,4,5,6,7,8,9]
 M.delete( recordIDs )
 
+# series directories are removed in the background - wait for that to finish before continuing
+M.delete( recordIDs, wait=True )
+
 
 # record note about multiple series
 seriesInstanceUIDs = [
@@ -77,6 +157,56 @@ noteIDs = [1,2,3,4,5]
 M.deleteNotes( noteIDs )
 
 
+# find series by the hashtags in their notes - e.g. reviewed, good quality, and without artifacts
+recordIDs = M.getTaggedSeries( include=['#reviewed', '#quality:3'], exclude=['#artifacts', '#blackImage'] )
+
+
+# find series by full-text search of their series/study descriptions, protocol names and notes (SQLite FTS5 query syntax)
+recordIDs = M.search( 'SeriesDescription:(mprage OR spgr OR bravo) NOT tof NOT "post gad"' )
+recordIDs = M.search( 'flair*', limit=100 )
+
+
+# get summary statistics, kept up to date as series are recorded, stored and deleted - for the whole archive,
+# or by the values of a column set in dicommanagersettings.py (e.g. series, DICOM, study and patient counts per modality)
+M.getStats()
+M.getStats( 'Modality' )
+M.getStats( 'MagneticFieldStrength' )
+
+# recompute the summary statistics, e.g. after changing the summarized columns
+M.rebuildStats()
+
+
+# classify series by the rules set in dicommanagersettings.py into the Features table - only series not classified yet
+# (full=True classifies all series again, e.g. after changing the rules)
+import dicomfeatures
+F = dicomfeatures.DicomFeatures( M )
+F.run()
+F.run( full=True )
+
+
+# after adding tags to tagsToRecord in dicommanagersettings.py, DicomManager() adds their columns to the series table -
+# fill them for the series already recorded, from one stored DICOM per series read in worker processes
+# (this first records the stored DICOMs of series recorded before DICOMs were recorded per instance, see Instances)
+M.backfill()
+M.backfill( numWorkers=8 )
+
+# fill given columns again for all series, e.g. after changing how their values are recorded
+# (columns in storage paths, like SeriesDescription, keep their values where filling them would move a series' directory)
+M.backfill( columns=['EchoTime', 'RepetitionTime'], full=True )
+
+
+# check the managed filetree against the database: series with a different number of DICOMs than recorded,
+# series whose directory is missing, and series directories without a series record
+problems = M.verify()
+problems = M.verify( incremental=True )          # only lists series directories modified since the last check
+
+# repair the problems found, or some kinds of them
+M.verify( repair=True )
+M.verify( repair=['counts', 'orphans'] )
+
+# here is a script to check and repair the managed filetree interactively (python verify_dicoms.py)
+
+
 # here is an executable python script to perform DicomManager.manage()
 # which means you enter this directly in the terminal window
 cd ~/the/location/of/these/files
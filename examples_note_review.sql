@@ -27,17 +27,7 @@ FROM
 	Series
 WHERE
 (
-	(
-		PatientAge < '007D'
-		AND
-		PatientAge LIKE '%D%'
-	)
-	OR
-	(
-		PatientAge < '002W'
-		AND
-		PatientAge LIKE '%W%'
-	)
+	AgeInDays BETWEEN 0 AND 6			-- week 0, using the AgeInDays index (from study and birth dates, else PatientAge)
 )										--n=4029
 AND
 (
@@ -5,6 +5,7 @@ import os
 import sys
 import shutil
 import fnmatch
+import multiprocessing
 import dicommanager
 
 # add working directory to search path
@@ -28,14 +29,10 @@ if ans == "y":
     if ans == "y":
         deleteSrcTree = True
 
-# find DICOMs under given directory
-print "Finding DICOMs to manage..."
-dcmPaths = M.find(rootDir)
-print "Found %d DICOMs." % len(dcmPaths)
-
-# mange all found DICOMs
-print "Reading, recording, and storing DICOMs..."
-M.manage( dcmPaths, deleteSrcDicoms )
+# find DICOMs under given directory, managing them as they're found
+print "Finding, reading, recording, and storing DICOMs..."
+dcmPaths = M.iterFind(rootDir)
+M.manage( dcmPaths, deleteSrcDicoms, numWorkers=multiprocessing.cpu_count() )
 print "Done."
 
 # delete file tree under 'dcmRoot' if requested
@@ -0,0 +1,146 @@
+# test_backfill.py
+#
+# run with: python -m unittest test_backfill
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import dicom
+from dicom.dataset import Dataset, FileDataset
+
+import dicommanager
+import dicommanagersettings
+
+
+#------------------------------------------------------------------------------------------------
+# writes a small MR series of DICOM files into a directory
+def writeSeries ( dir, seriesIdx, numDicoms=2 ):
+    for dcmIdx in xrange(numDicoms):
+        fileMeta = Dataset()
+        fileMeta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.4'
+        fileMeta.MediaStorageSOPInstanceUID = '1.2.3.%d.%d' % ( seriesIdx, dcmIdx )
+        fileMeta.TransferSyntaxUID = '1.2.840.10008.1.2.1'
+        fileMeta.ImplementationClassUID = '1.2.3.4'
+
+        dcmPath = os.path.join( dir, 'series%d_%d.dcm' % ( seriesIdx, dcmIdx ) )
+        dcm = FileDataset( dcmPath, {}, file_meta=fileMeta, preamble="\0" * 128 )
+        dcm.SOPClassUID = fileMeta.MediaStorageSOPClassUID
+        dcm.SOPInstanceUID = fileMeta.MediaStorageSOPInstanceUID
+        dcm.Modality = 'MR'
+        dcm.InstitutionName = 'Hospital'
+        dcm.Manufacturer = 'Manufacturer'
+        dcm.ManufacturersModelName = 'Model'
+        dcm.DeviceSerialNumber = '0000'
+        dcm.PatientID = 'P%d' % seriesIdx
+        dcm.PatientName = 'Doe^J'
+        dcm.PatientSex = 'F'
+        dcm.PatientBirthDate = '20000101'
+        dcm.StudyDate = '20010101'
+        dcm.AccessionNumber = 'A%d' % seriesIdx
+        dcm.StudyDescription = 'BRAIN'
+        dcm.SeriesDescription = 'T1 MPRAGE'
+        dcm.ProtocolName = 'proto'
+        dcm.StudyInstanceUID = '1.2.3.%d' % seriesIdx
+        dcm.SeriesInstanceUID = '1.2.3.%d.9' % seriesIdx
+        dcm.InstanceNumber = dcmIdx + 1
+        dcm.EchoTime = '3'
+        dcm.is_little_endian = True
+        dcm.is_implicit_VR = False
+        dcm.save_as(dcmPath)
+
+
+
+class BackfillTest ( unittest.TestCase ):
+
+    #--------------------------------------------------------------------------------------------
+    # a manager of a scratch database and filetree
+    def manager ( self, tagsToRecord=None ):
+        settings = dicommanagersettings.DicomManagerSettings()
+        settings.dbDir = self.scratchDir
+        settings.dbPath = os.path.join( self.scratchDir, 'dicommanager.sqlite' )
+        settings.rootDir = self.scratchDir
+        settings.dicomDir = os.path.join( self.scratchDir, 'DICOM' )
+        settings.blobDir = os.path.join( settings.dicomDir, '.blobs' )
+        settings.trashDir = os.path.join( self.scratchDir, 'Trash' )
+        if tagsToRecord is not None:
+            settings.tagsToRecord = tagsToRecord
+
+        manager = dicommanager.DicomManager( init=False )
+        manager.settings = settings
+        manager.init()
+        return manager
+
+    def setUp ( self ):
+        self.scratchDir = tempfile.mkdtemp()
+        self.srcDir = os.path.join( self.scratchDir, 'src' )
+        os.makedirs( self.srcDir )
+        for seriesIdx in xrange(3):
+            writeSeries( self.srcDir, seriesIdx )
+
+    def tearDown ( self ):
+        shutil.rmtree( self.scratchDir )
+
+    #--------------------------------------------------------------------------------------------
+    # columns are backfilled once for every series, including series whose DICOMs don't have their tags
+    def testBackfillTagsMissingFromDicoms ( self ):
+        manager = self.manager()
+        manager.manage( manager.find(self.srcDir) )
+        manager.dbCon.close()
+
+        # Pixel Spacing, Image Comments - not in the test DICOMs
+        manager = self.manager( manager.settings.tagsToRecord + [ 0x00280030, 0x00204000 ] )
+        pending = [ row[0] for row in manager.dbCon.execute( "SELECT ColumnName FROM %s" % manager.settings.dbTblBackfills ) ]
+        self.assertEqual( sorted(pending), [ 'ImageComments', 'PixelSpacing' ] )
+
+        self.assertEqual( manager.backfill( numWorkers=1 ), 3 )
+        self.assertEqual( manager.dbCon.execute( "SELECT COUNT(*) FROM %s" % manager.settings.dbTblBackfills ).fetchone()[0], 0 )
+        self.assertEqual( manager.dbCon.execute( "SELECT COUNT(*) FROM %s" % manager.settings.dbTblBackfillSeries ).fetchone()[0], 0 )
+        self.assertEqual( [ record.ImageComments for record in manager.iterSeries() ], [ None, None, None ] )
+
+        # nothing is left to backfill
+        self.assertEqual( manager.backfill( numWorkers=1 ), 0 )
+
+    #--------------------------------------------------------------------------------------------
+    # series whose DICOMs couldn't be read stay listed to be backfilled
+    def testBackfillUnreadSeriesStayPending ( self ):
+        manager = self.manager()
+        manager.manage( manager.find(self.srcDir) )
+        manager.dbCon.close()
+
+        manager = self.manager( manager.settings.tagsToRecord + [ 0x00204000 ] )
+        seriesDir = manager.getSeriesDir( seriesUID='1.2.3.0.9' )
+        shutil.move( seriesDir, seriesDir + '_moved' )
+        manager.dbCon.execute( "DELETE FROM %s" % manager.settings.dbTblInstances )
+        manager.dbCon.commit()
+
+        self.assertEqual( manager.backfill( numWorkers=1 ), 2 )
+        pending = [ row[0] for row in manager.dbCon.execute( "SELECT ColumnName FROM %s" % manager.settings.dbTblBackfills ) ]
+        self.assertEqual( pending, [ 'ImageComments' ] )
+
+        # the series is filled once its DICOMs are back
+        shutil.move( seriesDir + '_moved', seriesDir )
+        self.assertEqual( manager.backfill( numWorkers=1 ), 1 )
+        self.assertEqual( manager.dbCon.execute( "SELECT COUNT(*) FROM %s" % manager.settings.dbTblBackfills ).fetchone()[0], 0 )
+
+
+    #--------------------------------------------------------------------------------------------
+    # the stored instances of series recorded before their instances were are recorded from their storage directories
+    def testBackfillInstances ( self ):
+        manager = self.manager()
+        manager.manage( manager.find(self.srcDir) )
+        qInstances = "SELECT SOPInstanceUID, SeriesId, InstanceNumber, StoragePath, FileSize, TransferSyntaxUID FROM %s ORDER BY SOPInstanceUID" % manager.settings.dbTblInstances
+        instances = [ tuple(row) for row in manager.dbCon.execute( qInstances ) ]
+        manager.dbCon.execute( "DELETE FROM %s" % manager.settings.dbTblInstances )
+        manager.dbCon.commit()
+
+        self.assertEqual( manager.backfill( numWorkers=1 ), 0 )
+        self.assertEqual( [ tuple(row) for row in manager.dbCon.execute( qInstances ) ], instances )
+        self.assertEqual( manager.backfillInstances( numWorkers=1 ), 0 )
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+# verify_dicoms.py
+
+# imports
+import os
+import sys
+import dicommanager
+
+# add working directory to search path
+sys.path.insert(0, os.path.realpath(__file__))
+
+# instantiate dicom manager
+M = dicommanager.DicomManager()
+
+# inquire about checking only directories modified since the last check
+incremental = False
+ans = raw_input("Check only series directories modified since the last check? (y/n): ").strip()
+if ans == "y":
+    incremental = True
+
+# check the managed filetree against the database
+print "Checking the DICOM storage directory against the database..."
+problems = M.verify( incremental=incremental )
+
+for problem in problems['counts']:
+    print "Series %d has %d DICOMs, not %d: %s" % ( problem['recordID'], problem['found'], problem['recorded'], problem['seriesDir'] )
+for problem in problems['missing']:
+    print "Series %d directory not found: %s" % ( problem['recordID'], problem['seriesDir'] )
+for seriesDir in problems['orphans']:
+    print "Series directory not recorded: %s" % seriesDir
+
+# inquire about repairing the problems found
+if problems['counts'] or problems['missing'] or problems['orphans']:
+    ans = raw_input("Repair? (y/n): ").strip()
+    if ans == "y":
+        M.verify( repair=True, incremental=True )
+
+print "Done."